@@ -1,90 +1,298 @@
 # backend/app/api/endpoints/images.py
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.utils.supabase_client import upload_file_supabase
-from PIL import Image
-import io
-from fastapi import Form
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from app.schemas.image import MultiCropRequest
-from app.utils.supabase_client import upload_file_supabase
-from PIL import Image
-import io
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from app.config import AUTO_CROP_MAX_SIDE, CROP_THUMBNAIL_WIDTHS, PDF_DEFAULT_DPI, PDF_MAX_DPI
+from app.services import (
+    admission, crop_engine, detection, encoding, image_cache, jobs, pdf_ingest, question_images, storage_index,
+)
+from app.services.archive import ZipArchive
+from app.services.image_cache import SourceImage
+from app.utils import ingest, metrics
+from typing import Callable, List, Optional, Sequence, Tuple
+import asyncio
 import json
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
-import cv2
-import numpy as np
-import io
-from PIL import Image
-from app.utils.supabase_client import upload_file_supabase
+import os
 
 
 
 router = APIRouter()
 
-@router.post("/upload")
-async def upload_image(file: UploadFile = File(...)):
+def output_settings(
+    output_format: Optional[str], quality: Optional[int], speed: Optional[str], source_format: Optional[str]
+) -> encoding.OutputSettings:
+    """Resolves the crop encoding form fields (see app.services.encoding) or answers 400."""
+    try:
+        return encoding.resolve(output_format, quality, speed, source_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def read_source(file: Optional[UploadFile], source_id: Optional[str]) -> SourceImage:
+    """
+    Resolves the image a crop request works on: a registered `source_id`, or an
+    uploaded `file`. Files whose bytes were seen recently reuse the cached
+    decoded pixels; otherwise only the header is read here and pixels are
+    decoded by ensure_decoded() or pixels_for() when actually needed.
+    """
+    if source_id:
+        source = image_cache.cache.get(source_id)
+        if source is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired source_id. Register the image again.")
+        return source
+    if file is None:
+        raise HTTPException(status_code=400, detail="Either 'file' or 'source_id' is required.")
+
+    with metrics.stage("read"):
+        image_data = await ingest.read_upload(file)
+    with metrics.stage("digest"):
+        digest = await crop_engine.run_in_pool(storage_index.content_digest, image_data)
+    cached = image_cache.cache.get(digest)
+    if cached is not None:
+        return cached
     try:
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
+        image = crop_engine.open_image(image_data)
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid image file") from e
+    return SourceImage(source_id=digest, image=image, format=image.format, filename=file.filename, data=image_data)
 
-    buffer = io.BytesIO()
-    image.save(buffer, format=image.format)
-    buffer.seek(0)
-
+async def ensure_decoded(source: SourceImage):
+    """Decodes the source pixels off the event loop (once) and caches them."""
+    if source.decoded:
+        return
     try:
-        public_url = upload_file_supabase(file_obj=buffer, destination_path=file.filename)
+        with metrics.stage("decode"):
+            await crop_engine.run_in_pool(source.image.load)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    return {"filename": file.filename, "url": public_url}
+        raise HTTPException(status_code=400, detail="Invalid image file") from e
+    metrics.BYTES_DECODED.inc(source.nbytes)
+    source.decoded = True
+    source.data = None
+    image_cache.cache.put(source)
 
-# backend/app/api/endpoints/images.py (add below your /upload endpoint)
+# Above this share of the page, decode (and cache) the whole image instead of a region
+REGION_DECODE_MAX_FRACTION = 0.5
 
-@router.post("/crop")
-async def crop_image(
-    file: UploadFile = File(...),
-    left: int = Form(...),
-    top: int = Form(...),
-    right: int = Form(...),
-    bottom: int = Form(...)
-):
-    # Read and open the image
+async def pixels_for(source: SourceImage, boxes):
+    """
+    Returns (image, (x, y) offset of the image in the source) covering `boxes`.
+    Uncached JPEG and tiled uploads whose crops need only a small part of the
+    page get just that part decoded (crop_engine.load_region), so memory
+    follows the cropped area rather than the page size. Everything else is
+    decoded whole and cached for the next request.
+    """
+    region = crop_engine.bounding_box(boxes)
+    if source.decoded or source.data is None or crop_engine.region_fraction(source.image, region) > REGION_DECODE_MAX_FRACTION:
+        await ensure_decoded(source)
+        return source.image, (0, 0)
     try:
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
+        with metrics.stage("decode"):
+            image, offset = await crop_engine.run_in_pool(crop_engine.load_region, source.data, region)
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid image file") from e
+    metrics.BYTES_DECODED.inc(image_cache.image_nbytes(image))
+    return image, offset
+
+def shift_box(box, offset):
+    x, y = offset
+    return (box[0] - x, box[1] - y, box[2] - x, box[3] - y)
 
-    # Perform cropping using Pillow
+async def admit(estimate: int, slot: bool = True) -> admission.Reservation:
+    """
+    Reserves a processing slot (unless `slot` is False) and `estimate` bytes;
+    503 with Retry-After while the router is saturated.
+    """
     try:
-        cropped_image = image.crop((left, top, right, bottom))
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Error cropping image") from e
+        return await admission.controller.reservation(estimate, slot).acquire()
+    except admission.Saturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
-    # Save the cropped image to an in-memory buffer
-    buffer = io.BytesIO()
-    cropped_image.save(buffer, format=image.format)
-    buffer.seek(0)
+async def upload_estimate(file: UploadFile, bytes_per_pixel: Optional[int] = None) -> int:
+    """
+    Peak memory of processing an upload: its encoded size plus its decoded
+    pixels, read from the header only. `bytes_per_pixel` replaces the
+    image's band count (e.g. 4 for OpenCV's BGR copy plus a grayscale one).
+    """
+    header = await crop_engine.run_in_pool(admission.decoded_size, file.file)
+    if header is None:
+        return file.size or 0
+    width, height, bands = header
+    return (file.size or 0) + width * height * (bytes_per_pixel or bands)
+
+async def image_estimate(
+    file: Optional[UploadFile], source_id: Optional[str], bytes_per_pixel: Optional[int] = None
+) -> Tuple[int, int]:
+    """
+    (bytes of the upload held until the work is done, bytes of its decoded
+    working copies) for a request on one image. A registered source is
+    already decoded (and counted by the image cache), so it only needs the
+    working copies `bytes_per_pixel` describes.
+    """
+    if source_id:
+        source = image_cache.cache.peek(source_id)
+        return 0, source.image.width * source.image.height * bytes_per_pixel if source and bytes_per_pixel else 0
+    if file is None:
+        return 0, 0
+    held = file.size or 0
+    return held, await upload_estimate(file, bytes_per_pixel) - held
+
+async def admit_image(file: Optional[UploadFile], source_id: Optional[str], bytes_per_pixel: Optional[int] = None):
+    """Admits a request working on one image before the upload is read or decoded."""
+    held, working = await image_estimate(file, source_id, bytes_per_pixel)
+    return await admit(held + working)
+
+@router.post("/sources")
+async def register_source(file: UploadFile = File(...)):
+    """
+    Registers a source image once and returns its `source_id`. Later /crop,
+    /multicrop and /auto_crop calls can pass `source_id` instead of re-sending
+    the file. The id is the content hash of the image, so registering the same
+    bytes twice returns the same id. Registrations live in a per-process,
+    memory-bounded cache and expire after IMAGE_CACHE_TTL_SECONDS.
+    """
+    with await admit_image(file, None):
+        source = await read_source(file, None)
+        await ensure_decoded(source)
+        if source.nbytes > image_cache.cache.max_bytes:
+            raise HTTPException(status_code=413, detail="Image is too large for the decoded image cache.")
+        return {
+            "source_id": source.source_id,
+            "filename": source.filename,
+            "format": source.format,
+            "width": source.image.width,
+            "height": source.image.height,
+            "bytes": source.nbytes,
+            "expires_in": image_cache.cache.ttl_seconds,
+        }
+
+@router.get("/sources/stats")
+async def source_cache_stats():
+    return image_cache.cache.stats()
+
+@router.get("/admission/stats")
+async def admission_stats():
+    return admission.controller.stats()
+
+@router.delete("/sources/{source_id}")
+async def delete_source(source_id: str):
+    if not image_cache.cache.remove(source_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired source_id.")
+    return {"message": "Source removed", "source_id": source_id}
 
-    # Upload the cropped image to Supabase Storage (prefix filename with 'cropped_')
+@router.post("/upload")
+async def upload_image(file: UploadFile = File(...)):
+    """
+    Uploads an image under a content-addressed key; uploading the same bytes
+    again returns the existing URL without another upload. Only the header
+    is checked: the original bytes are stored as sent, never decoded or
+    re-encoded.
+    """
     try:
-        public_url = upload_file_supabase(file_obj=buffer, destination_path="cropped_" + file.filename)
+        with metrics.stage("read"):
+            image_data = await ingest.read_upload(file)
+        image_format = crop_engine.open_image(image_data).format
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    return {"filename": file.filename, "url": public_url}
+        raise HTTPException(status_code=400, detail="Invalid image file") from e
+
+    with metrics.stage("digest"):
+        digest = await crop_engine.run_in_pool(storage_index.content_digest, image_data)
+    key = storage_index.upload_key(digest, crop_engine.extension_for(image_format))
+
+    async def encode_missing(keys):
+        return [image_data]
+
+    [stored] = await storage_index.store_objects(
+        [key], encode_missing, crop_engine.content_type_for(image_format)
+    )
+    if not stored["success"]:
+        raise HTTPException(status_code=500, detail=stored["error"])
+
+    return {"filename": file.filename, "url": stored["url"], "deduplicated": stored["deduplicated"]}
+
+# backend/app/api/endpoints/images.py (add below your /upload endpoint)
+
+@router.post("/crop")
+async def crop_image(
+    file: Optional[UploadFile] = File(None),
+    left: int = Form(...),
+    top: int = Form(...),
+    right: int = Form(...),
+    bottom: int = Form(...),
+    source_id: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    speed: Optional[str] = Form(None),
+):
+    """
+    Crops one region. `output_format` (original, png, jpeg, webp, webp_lossless),
+    `quality` and `speed` (fast, balanced, small) choose the encoding; unset
+    fields use the deployment defaults.
+    """
+    with await admit_image(file, source_id):
+        # Resolve the source; pixels are only decoded if this crop is not stored yet
+        source = await read_source(file, source_id)
+        settings = output_settings(output_format, quality, speed, source.format)
+
+        box = (left, top, right, bottom)
+        key = storage_index.crop_key(source.source_id, box, settings.variant, settings.extension)
+
+        async def encode_missing(keys):
+            # Decode (only the needed region when possible), crop and encode on the crop pool
+            image, offset = await pixels_for(source, [box])
+            try:
+                with metrics.stage("crop_encode"):
+                    data = await crop_engine.run_in_pool(crop_engine.crop_and_encode, image, shift_box(box, offset), settings)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail="Error cropping image") from e
+            metrics.BYTES_ENCODED.inc(len(data), format=settings.format)
+            return [data]
+
+        [stored] = await storage_index.store_objects([key], encode_missing, settings.content_type)
+        if not stored["success"]:
+            raise HTTPException(status_code=500, detail=stored["error"])
+
+        return {
+            "filename": file.filename if file else source.filename,
+            "url": stored["url"],
+            "deduplicated": stored["deduplicated"],
+        }
 
 # backend/app/api/endpoints/images.py
 
 
 
+def parse_crops_form(crops: str):
+    try:
+        crop_data = json.loads(crops)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid crop data format. Must be valid JSON.")
+    try:
+        parsed_crops = crop_engine.parse_crop_boxes(crop_data)
+        question_images.validate_targets(parsed_crops)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return parsed_crops
+
+def parse_thumbnail_widths(value: Optional[str]) -> List[int]:
+    """Parses a comma-separated width list such as "256,768" (default CROP_THUMBNAIL_WIDTHS)."""
+    value = CROP_THUMBNAIL_WIDTHS if value is None else value
+    try:
+        widths = sorted({int(width) for width in value.split(",") if width.strip()}, reverse=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="thumbnail_widths must be comma-separated integers.")
+    if any(not 16 <= width <= 4096 for width in widths):
+        raise HTTPException(status_code=400, detail="thumbnail_widths must be between 16 and 4096.")
+    return widths
+
 @router.post("/multicrop")
 async def multicrop_image(
-    file: UploadFile = File(...),
-    crops: str = Form(...)
+    file: Optional[UploadFile] = File(None),
+    crops: str = Form(...),
+    source_id: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    speed: Optional[str] = Form(None),
+    thumbnail_widths: Optional[str] = Form(None),
+    response_mode: str = Form("urls"),
 ):
     """
     Accepts an image file ('file') and a JSON string ('crops') representing 
@@ -97,142 +305,658 @@ async def multicrop_image(
     
     Each crop object must have left, top, right, bottom (integers).
     'name' is optional and defaults to 'crop_<index>'.
+
+    Instead of 'file', a 'source_id' from POST /images/sources can be passed.
+
+    `output_format` (original, png, jpeg, webp, webp_lossless), `quality` and
+    `speed` (fast, balanced, small) choose the encoding of every crop; unset
+    fields use the deployment defaults. For text-heavy scans "webp" or "jpeg"
+    is much faster to encode and much smaller than re-saving a PNG source.
+
+    `thumbnail_widths` (e.g. "256,768") adds resized derivatives of every
+    crop narrower than the crop itself, made in the same pass and stored next
+    to it as "<key>_w<width>.<ext>"; their URLs are returned per crop under
+    "derivatives". Crops that carry "question_id" (and "type": "option" with
+    "option_index" for option images) also get those URLs recorded on the
+    question document (see app.services.question_images).
+
+    Crops are stored under content-addressed keys (hash of the image bytes,
+    the box and the output settings), so repeating a crop returns the stored
+    URL without encoding or uploading it again.
+
+    With `response_mode` "zip" nothing is stored: the crops are streamed back
+    as a ZIP archive instead (see stream_crops_zip; no derivatives).
+    """
+    if response_mode not in ("urls", "zip"):
+        raise HTTPException(status_code=400, detail="response_mode must be 'urls' or 'zip'.")
+    # 1. Parse and validate the 'crops' JSON string before doing any image work
+    parsed_crops = parse_crops_form(crops)
+    widths = parse_thumbnail_widths(thumbnail_widths)
+
+    # 2. Wait for a processing slot, then resolve the source; pixels are only decoded
+    #    if some crop is not stored yet
+    reservation = await admit_image(file, source_id)
+    streaming = False
+    try:
+        source = await read_source(file, source_id)
+        settings = output_settings(output_format, quality, speed, source.format)
+        filename = file.filename if file else source.filename
+        if response_mode == "zip":
+            response = zip_response([("", source, filename, parsed_crops, settings)], filename, reservation)
+            streaming = True
+            return response
+        return await run_multicrop(source, parsed_crops, filename, settings, widths)
+    finally:
+        # A streamed archive releases its reservation once it is sent
+        if not streaming:
+            reservation.release()
+
+@router.post("/multicrop/archive")
+async def multicrop_archive(
+    files: List[UploadFile] = File(...),
+    crops: str = Form(...),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    speed: Optional[str] = Form(None),
+):
+    """
+    Crops a batch of pages in one round trip and streams the crops back as a
+    single ZIP archive; nothing is stored. `crops` is either one JSON crop
+    list (as for /multicrop) applied to every file, or a list of such lists,
+    one per file in upload order. Each file's crops go into a folder named
+    "<file number>_<file name>/". Encoding options are as for /multicrop.
     """
-    # 1. Parse the 'crops' JSON string
     try:
         crop_data = json.loads(crops)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid crop data format. Must be valid JSON.")
-
-    # 2. Read and open the original image
+    if isinstance(crop_data, list) and crop_data and all(isinstance(item, list) for item in crop_data):
+        if len(crop_data) != len(files):
+            raise HTTPException(status_code=400, detail="Provide one crop list per file, or a single crop list for all files.")
+        per_file = [parse_crops_form(json.dumps(item)) for item in crop_data]
+    else:
+        per_file = [parse_crops_form(crops)] * len(files)
+
+    # Pages are decoded one at a time, but every upload is read before the response starts
+    estimates = [await upload_estimate(file) for file in files]
+    sizes = [file.size or 0 for file in files]
+    reservation = await admit(sum(sizes) + max(estimate - size for estimate, size in zip(estimates, sizes)))
     try:
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid image file or unable to open.")
-
-    # 3. Crop each region and upload
-    results = []
-    for idx, crop in enumerate(crop_data):
-        # Name field (optional); default to "crop_{idx}"
-        crop_name = crop.get("name", f"{crop['name']}.png")
-
-        # Extract coordinates (required)
+        # Validate every upload (header only) before the response starts
+        pages = []
+        for number, (file, parsed_crops) in enumerate(zip(files, per_file), start=1):
+            source = await read_source(file, None)
+            settings = output_settings(output_format, quality, speed, source.format)
+            stem = os.path.splitext(os.path.basename(file.filename or "page"))[0]
+            pages.append((f"{number:03d}_{stem}/", source, file.filename, parsed_crops, settings))
+    except BaseException:
+        reservation.release()
+        raise
+    return zip_response(pages, "crops", reservation)
+
+def zip_response(pages, filename: Optional[str], reservation: admission.Reservation) -> StreamingResponse:
+    """Streams the archive, releasing `reservation` when it is sent or the client goes away."""
+    async def chunks():
         try:
-            left = int(crop["left"])
-            top = int(crop["top"])
-            right = int(crop["right"])
-            bottom = int(crop["bottom"])
-        except KeyError:
-            raise HTTPException(status_code=400, detail="Missing one of [left, top, right, bottom].")
-
-        # Perform the crop
+            async for chunk in stream_crops_zip(pages):
+                yield chunk
+        finally:
+            reservation.release()
+
+    stem = os.path.splitext(os.path.basename(filename or "crops"))[0]
+    return StreamingResponse(
+        chunks(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{stem}_crops.zip"'},
+        # Also covers a response cut off before the stream started
+        background=BackgroundTask(reservation.release),
+    )
+
+async def stream_crops_zip(pages):
+    """
+    Yields a ZIP archive of the crops of `pages` ((folder, source, filename,
+    parsed crops, output settings) tuples), one entry as soon as each crop is
+    encoded, so the archive is never held in memory. Entries are named
+    "<folder><crop index>_<name><ext>"; the last entry, manifest.json, lists
+    every crop's entry name and box and any error, since the status code is
+    already sent by the time a page fails.
+    """
+    archive = ZipArchive()
+    manifest = []
+    for folder, source, filename, parsed_crops, settings in pages:
+        entries = {}
+        page = {"filename": filename, "source_id": source.source_id, "folder": folder, "crops": [], "error": None}
+        if not parsed_crops:
+            # Nothing to decode for a page without crops
+            manifest.append(page)
+            continue
         try:
-            cropped_image = image.crop((left, top, right, bottom))
+            image, offset = await pixels_for(source, [crop["box"] for crop in parsed_crops])
+            boxes = [shift_box(crop["box"], offset) for crop in parsed_crops]
+            async for index, data in crop_engine.crop_stream(image, boxes, settings):
+                crop = parsed_crops[index]
+                name = crop["name"].replace("/", "_").replace("\\", "_")
+                entries[index], chunk = archive.add(f"{folder}{crop['index']:03d}_{name}{settings.extension}", data)
+                metrics.BYTES_ENCODED.inc(len(data), format=settings.format)
+                yield chunk
+        except HTTPException as e:
+            page["error"] = e.detail
         except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error cropping image: {str(e)}")
-
-        # Convert to bytes for uploading
-        buffer = io.BytesIO()
-        cropped_image.save(buffer, format=image.format)
-        buffer.seek(0)
-
-        # Generate a filename that includes the index or name
-        # You could also incorporate 'crop_name' here if desired:
-        #  e.g., crop_filename = f"{crop_name}_{file.filename}"
-        # crop_filename = f"crop_{idx}_{file.filename}"
-        crop_filename = f"{crop['name']}.png"   
-
-        # Upload to Supabase (or your storage service)
+            page["error"] = f"Error cropping image: {str(e)}"
+        page["crops"] = [
+            {"index": crop["index"], "name": crop["name"], "box": list(crop["box"]), "entry": entries.get(index)}
+            for index, crop in enumerate(parsed_crops)
+        ]
+        manifest.append(page)
+
+    _, chunk = archive.add("manifest.json", json.dumps({"pages": manifest}, indent=2).encode())
+    yield chunk
+    yield archive.close()
+
+async def run_multicrop(
+    source: SourceImage,
+    parsed_crops,
+    filename: Optional[str],
+    settings: encoding.OutputSettings,
+    thumbnail_widths: Sequence[int] = (),
+    report: Optional[Callable] = None,
+) -> dict:
+    """
+    Crops, encodes and stores the parsed crops of one source, plus their
+    derivatives at `thumbnail_widths`. Shared by /multicrop and multicrop jobs;
+    `report(stage, done, total, item)` receives progress for every encoded and
+    stored object.
+    """
+    # 3. Content-addressed keys: same source bytes + box + output settings -> same object
+    crop_keys = [
+        storage_index.crop_key(source.source_id, crop["box"], settings.variant, settings.extension)
+        for crop in parsed_crops
+    ]
+    # key -> (box, width); width None is the full-size crop
+    targets = {}
+    derivative_keys = []
+    for crop, key in zip(parsed_crops, crop_keys):
+        targets[key] = (crop["box"], None)
+        left, _, right, _ = crop["box"]
+        widths = {width: storage_index.derivative_key(key, width) for width in thumbnail_widths if width < right - left}
+        for width, derivative in widths.items():
+            targets[derivative] = (crop["box"], width)
+        derivative_keys.append(widths)
+    keys = crop_keys + [key for widths in derivative_keys for key in widths.values()]
+
+    async def encode_missing(missing_keys):
+        # Decode once (only the region the missing crops cover when possible), then crop
+        # every missing region once and encode each missing size, in parallel
+        sizes_by_box = {}
+        for key in missing_keys:
+            box, width = targets[key]
+            sizes_by_box.setdefault(box, []).append(width)
+        image, offset = await pixels_for(source, list(sizes_by_box))
+        on_done = (lambda done, total: report("encode", done, total)) if report else None
         try:
-            public_url = upload_file_supabase(file_obj=buffer, destination_path=crop_filename)
+            with metrics.stage("crop_encode"):
+                encoded = await crop_engine.crop_many(
+                    image, [shift_box(box, offset) for box in sizes_by_box], settings,
+                    on_done=on_done, widths=list(sizes_by_box.values()),
+                )
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Error cropping image: {str(e)}")
+        data_by_target = {
+            (box, width): data
+            for (box, widths), datas in zip(sizes_by_box.items(), encoded)
+            for width, data in zip(widths, datas)
+        }
+        metrics.BYTES_ENCODED.inc(sum(len(data) for data in data_by_target.values()), format=settings.format)
+        return [data_by_target[targets[key]] for key in missing_keys]
+
+    # 4. Encode and upload only what is not stored yet (uploads run concurrently)
+    uploads = await storage_index.store_objects(keys, encode_missing, settings.content_type, report=report)
+    uploads_by_key = {upload["destination_path"]: upload for upload in uploads}
+    if uploads and not any(uploads_by_key[key]["success"] for key in crop_keys):
+        raise HTTPException(status_code=500, detail=f"Upload error: {uploads[0]['error']}")
 
+    results = []
+    for crop, key, widths in zip(parsed_crops, crop_keys, derivative_keys):
+        upload = uploads_by_key[key]
         results.append({
-            "index": idx,
-            "name": crop_name,
-            "filename": crop_filename,
-            "url": public_url
+            "index": crop["index"],
+            "name": crop["name"],
+            "filename": upload["destination_path"],
+            "url": upload["url"],
+            "uploaded": upload["success"],
+            "deduplicated": upload["deduplicated"],
+            "error": upload["error"],
+            "derivatives": {
+                str(width): uploads_by_key[derivative]["url"]
+                for width, derivative in widths.items() if uploads_by_key[derivative]["success"]
+            },
         })
 
-    return {
-        "original_filename": file.filename,
+    response = {
+        "original_filename": filename,
         "num_crops": len(results),
+        "num_failed": sum(1 for result in results if not result["uploaded"]),
         "crops": results
     }
+    # 5. Record derivative URLs on the questions the crops belong to
+    if thumbnail_widths and any(crop["target"] for crop in parsed_crops):
+        response["questions_updated"] = await question_images.record_derivatives(parsed_crops, results)
+    return response
 
 @router.post("/auto_crop")
-async def auto_crop_scans(file: UploadFile = File(...)) -> dict:
+async def auto_crop_scans(
+    file: Optional[UploadFile] = File(None),
+    max_side: int = Form(AUTO_CROP_MAX_SIDE),
+    min_area_ratio: float = Form(detection.DEFAULT_MIN_AREA_RATIO),
+    blur_kernel: int = Form(detection.DEFAULT_BLUR_KERNEL),
+    canny_low: int = Form(detection.DEFAULT_CANNY_LOW),
+    canny_high: int = Form(detection.DEFAULT_CANNY_HIGH),
+    source_id: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    speed: Optional[str] = Form(None),
+    detect_only: bool = Form(False),
+    overlap_threshold: float = Form(detection.DEFAULT_OVERLAP_THRESHOLD),
+) -> dict:
     """
     Automatically detects and crops multiple 'document regions' from a scanned image.
     Returns a list of URLs for each cropped image.
+
+    With `detect_only` nothing is encoded or stored: the response lists the
+    regions as left/top/right/bottom boxes, clipped to the page, with nested
+    or overlapping boxes (IoU or covered share above `overlap_threshold`)
+    merged, in reading order column by column. The boxes the user keeps can
+    be sent to /images/multicrop as they are.
+
+    Detection runs on a proxy scaled so its longest side is at most `max_side`
+    pixels; regions smaller than `min_area_ratio` of the page are ignored.
+    `blur_kernel`, `canny_low` and `canny_high` tune the edge detector.
+    Instead of 'file', a 'source_id' from POST /images/sources can be passed.
+    `output_format`, `quality` and `speed` choose the region encoding as for
+    /multicrop ("original" keeps the historical JPEG output).
     """
-    # 1. Read the uploaded file
-    try:
-        contents = await file.read()
-        # Convert to a NumPy array for OpenCV
-        np_img = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-        if image is None:
-            raise ValueError("Invalid image data.")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Could not read image file: {e}")
+    settings = output_settings(output_format, quality, speed, "JPEG")
+    options = {
+        "max_side": max_side, "min_area_ratio": min_area_ratio, "blur_kernel": blur_kernel,
+        "canny_low": canny_low, "canny_high": canny_high,
+    }
 
-    # 2. Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    # 3. (Optional) Apply blur or morphological operations to reduce noise
-    #    Helps with better contour detection
-    gray = cv2.GaussianBlur(gray, (5, 5), 0)
-
-    # 4. Edge detection or thresholding
-    #    (A) Canny edge detection
-    edges = cv2.Canny(gray, threshold1=50, threshold2=150)
-    #    (B) Alternatively, you could do a simple threshold:
-    # _, thresh = cv2.threshold(gray, 120, 255, cv2.THRESH_BINARY)
-
-    # 5. Find contours
-    #    For Canny, we find contours on 'edges'; for threshold, we find on 'thresh'.
-    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    # 6. Filter and sort contours (e.g., by area) to find the largest or most relevant
-    #    We'll keep all that exceed a certain area threshold.
-    min_area = 5000  # Adjust this based on your use case
-    valid_contours = []
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area > min_area:
-            valid_contours.append(cnt)
-
-    # Sort by descending area, in case you want the biggest "documents" first
-    valid_contours.sort(key=cv2.contourArea, reverse=True)
-
-    # 7. For each valid contour, crop and upload
-    cropped_urls = []
-    for idx, cnt in enumerate(valid_contours):
-        # Get bounding box (x, y, w, h)
-        x, y, w, h = cv2.boundingRect(cnt)
-
-        # Crop from the original image
-        cropped = image[y:y+h, x:x+w]
-
-        # Convert the cropped image back to a file-like object
-        # so we can upload it to Supabase.
-        _, cropped_encoded = cv2.imencode('.jpg', cropped)
-        cropped_bytes = io.BytesIO(cropped_encoded.tobytes())
-        cropped_filename = f"auto_crop_{idx}_{file.filename}"
-
-        # Upload to Supabase
+    # 1. Once a processing slot is free, decode the uploaded file (or take the
+    #    registered source) off the event loop
+    with await admit_image(file, source_id, bytes_per_pixel=4):
+        source, contents, filename = await read_page_input(file, source_id)
+        if detect_only:
+            return await run_detect_only(source, contents, filename, options, overlap_threshold)
+        image, digest = await decode_page(source, contents)
+        return await run_auto_crop(image, digest, filename, options, settings)
+
+async def run_detect_only(
+    source: Optional[SourceImage],
+    contents: Optional[bytes],
+    filename: Optional[str],
+    options: dict,
+    overlap_threshold: float,
+) -> dict:
+    """Detects the regions of one page and returns their arranged boxes without encoding anything."""
+    # Only a grayscale proxy is needed: JPEG uploads are decoded at reduced scale
+    if source is not None:
+        await ensure_decoded(source)
+        gray, full_size = await crop_engine.run_in_pool(detection.gray_from_pil, source.image), source.image.size
+    else:
         try:
-            public_url = upload_file_supabase(file_obj=cropped_bytes, destination_path=cropped_filename)
+            with metrics.stage("decode"):
+                gray, full_size = await crop_engine.run_in_pool(detection.decode_gray_proxy, contents, options["max_side"])
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Upload error: {e}")
+            raise HTTPException(status_code=400, detail=f"Could not read image file: {e}")
+        metrics.BYTES_DECODED.inc(gray.nbytes)
+
+    width, height = full_size
+    with metrics.stage("detect"):
+        regions = await crop_engine.run_in_pool(
+            detection.detect_regions, gray, options["max_side"], options["min_area_ratio"],
+            options["blur_kernel"], options["canny_low"], options["canny_high"], full_size,
+        )
+        regions = await crop_engine.run_in_pool(detection.arrange_boxes, regions, width, height, overlap_threshold)
+    return {
+        "original_filename": filename,
+        "width": width,
+        "height": height,
+        "num_boxes": len(regions),
+        "boxes": [{"left": x, "top": y, "right": x + w, "bottom": y + h} for x, y, w, h in regions],
+    }
 
-        cropped_urls.append({"filename": cropped_filename, "url": public_url})
+async def read_page_input(file: Optional[UploadFile], source_id: Optional[str]):
+    """Returns (registered source or None, uploaded bytes or None, filename) for auto-crop requests."""
+    if source_id:
+        source = await read_source(None, source_id)
+        return source, None, source.filename
+    if file is None:
+        raise HTTPException(status_code=400, detail="Either 'file' or 'source_id' is required.")
+    with metrics.stage("read"):
+        contents = await ingest.read_upload(file)
+    return None, contents, file.filename
+
+async def decode_page(source: Optional[SourceImage], contents: Optional[bytes]):
+    """Returns the page as a BGR array plus its content digest."""
+    if source is not None:
+        await ensure_decoded(source)
+        return await crop_engine.run_in_pool(detection.from_pil, source.image), source.source_id
+    try:
+        with metrics.stage("decode"):
+            image = await crop_engine.run_in_pool(detection.decode_color, contents)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read image file: {e}")
+    metrics.BYTES_DECODED.inc(image.nbytes)
+    with metrics.stage("digest"):
+        digest = await crop_engine.run_in_pool(storage_index.content_digest, contents)
+    return image, digest
+
+async def run_auto_crop(
+    image,
+    digest: str,
+    filename: Optional[str],
+    options: dict,
+    settings: encoding.OutputSettings,
+    report: Optional[Callable] = None,
+) -> dict:
+    """Detects, encodes and stores the regions of one decoded page (shared by /auto_crop and jobs)."""
+    # 2. Detect regions on the downscaled proxy; boxes come back at full resolution
+    with metrics.stage("detect"):
+        boxes = await crop_engine.run_in_pool(
+            detection.detect_regions, image, options["max_side"], options["min_area_ratio"],
+            options["blur_kernel"], options["canny_low"], options["canny_high"],
+        )
+    if report:
+        report("detect", len(boxes), len(boxes))
+
+    # 3. Encode and upload only the regions that are not stored yet
+    keys = [
+        storage_index.crop_key(digest, (x, y, x + w, y + h), settings.variant, settings.extension)
+        for x, y, w, h in boxes
+    ]
+    boxes_by_key = dict(zip(keys, boxes))
+
+    async def encode_missing(missing_keys):
+        done = 0
+
+        async def encode_one(key):
+            nonlocal done
+            data = await crop_engine.run_in_pool(detection.encode_region, image, boxes_by_key[key], settings)
+            done += 1
+            if report:
+                report("encode", done, len(missing_keys))
+            return data
+
+        with metrics.stage("crop_encode"):
+            encoded = await asyncio.gather(*(encode_one(key) for key in missing_keys))
+        metrics.BYTES_ENCODED.inc(sum(len(data) for data in encoded), format=settings.format)
+        return encoded
+
+    uploads = await storage_index.store_objects(keys, encode_missing, settings.content_type, report=report)
+    if uploads and not any(upload["success"] for upload in uploads):
+        raise HTTPException(status_code=500, detail=f"Upload error: {uploads[0]['error']}")
+
+    cropped_urls = [
+        {
+            "filename": upload["destination_path"],
+            "url": upload["url"],
+            "uploaded": upload["success"],
+            "deduplicated": upload["deduplicated"],
+            "error": upload["error"],
+        }
+        for upload in uploads
+    ]
 
     return {
-        "original_filename": file.filename,
+        "original_filename": filename,
         "num_crops": len(cropped_urls),
         "cropped_images": cropped_urls
     }
+
+@router.post("/pdf")
+async def ingest_pdf(
+    file: UploadFile = File(...),
+    dpi: int = Form(PDF_DEFAULT_DPI),
+    detect: bool = Form(False),
+    upload: bool = Form(True),
+    max_side: int = Form(AUTO_CROP_MAX_SIDE),
+    min_area_ratio: float = Form(detection.DEFAULT_MIN_AREA_RATIO),
+):
+    """
+    Rasterizes every page of a PDF question paper in parallel and streams the
+    results back as NDJSON, one line per page as soon as that page is done
+    (pages may arrive out of order):
+
+      {"type": "document", "filename": ..., "num_pages": 12, "dpi": 150}
+      {"type": "page", "page": 3, "width": ..., "height": ..., "url": ..., "boxes": [...]}
+      ...
+      {"type": "done"}
+
+    With `upload` each page PNG is stored (content-addressed, so pages already
+    stored at this DPI are not rendered again unless `detect` is set). With
+    `detect` the auto-crop detection runs on each page and "boxes" holds
+    left/top/right/bottom regions ready for /images/multicrop.
+    """
+    if not 36 <= dpi <= PDF_MAX_DPI:
+        raise HTTPException(status_code=400, detail=f"dpi must be between 36 and {PDF_MAX_DPI}.")
+
+    # 1. Spool the upload to disk so worker processes can open it by path
+    with metrics.stage("spool"):
+        path = await pdf_ingest.spool_to_disk(file)
+    try:
+        if not pdf_ingest.is_pdf(path):
+            raise HTTPException(status_code=400, detail="File is not a PDF.")
+        num_pages = await crop_engine.run_in_pool(pdf_ingest.count_pages, path)
+        page_bytes = await crop_engine.run_in_pool(pdf_ingest.render_estimate, path, dpi)
+        digest = await crop_engine.run_in_pool(storage_index.file_digest, path)
+    except HTTPException:
+        os.unlink(path)
+        raise
+    except Exception as e:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail=f"Could not read PDF: {e}")
+
+    # 2. Reserve memory for one window of pages rendering at once
+    try:
+        reservation = await admit(min(num_pages, pdf_ingest.RENDER_WINDOW) * page_bytes)
+    except HTTPException:
+        os.unlink(path)
+        raise
+
+    keys = {page: storage_index.page_key(digest, page, dpi, ".png") for page in range(1, num_pages + 1)}
+    detect_options = {"max_side": max_side, "min_area_ratio": min_area_ratio}
+
+    cleaned_up = False
+
+    def cleanup():
+        # Called when the stream ends and as the response's background task, which
+        # also runs when the client disconnects before the stream starts
+        nonlocal cleaned_up
+        if not cleaned_up:
+            cleaned_up = True
+            reservation.release()
+            os.unlink(path)
+
+    async def ndjson_lines():
+        try:
+            yield json.dumps({"type": "document", "filename": file.filename, "num_pages": num_pages, "dpi": dpi}) + "\n"
+
+            # 3. Pages already stored at this DPI need no rendering unless boxes are wanted
+            stored_pages = await storage_index.lookup(list(keys.values())) if upload and not detect else {}
+            to_render = []
+            for page, key in keys.items():
+                if key in stored_pages:
+                    yield json.dumps({
+                        "type": "page", "page": page, "url": stored_pages[key], "key": key,
+                        "deduplicated": True, "boxes": [],
+                    }) + "\n"
+                else:
+                    to_render.append(page - 1)
+
+            # 4. Render the rest on the process pool and stream each page when it is done
+            async for page in pdf_ingest.render_pages(path, to_render, dpi, detect, detect_options):
+                if "error" in page:
+                    yield json.dumps({"type": "page", "page": page["page"], "error": page["error"]}) + "\n"
+                    continue
+                line = {
+                    "type": "page", "page": page["page"], "width": page["width"], "height": page["height"],
+                    "boxes": page["boxes"],
+                }
+                metrics.BYTES_ENCODED.inc(len(page["data"]), format="PNG")
+                if upload:
+                    key = keys[page["page"]]
+
+                    async def encode_missing(missing_keys, data=page["data"]):
+                        return [data]
+
+                    [stored] = await storage_index.store_objects([key], encode_missing, "image/png")
+                    line.update(url=stored["url"], key=key, deduplicated=stored["deduplicated"], error=stored["error"])
+                yield json.dumps(line) + "\n"
+
+            yield json.dumps({"type": "done"}) + "\n"
+        finally:
+            cleanup()
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson", background=BackgroundTask(cleanup))
+
+async def admit_job(
+    file: Optional[UploadFile], source_id: Optional[str], bytes_per_pixel: Optional[int] = None
+) -> Tuple[admission.Reservation, int]:
+    """
+    Reserves the bytes of the upload a queued job holds (no processing slot;
+    503 once the byte budget is exhausted) and returns the reservation plus
+    the working bytes the job reserves with its slot when it starts.
+    """
+    held, working = await image_estimate(file, source_id, bytes_per_pixel)
+    return await admit(held, slot=False), working
+
+async def submit_job(kind: str, runner, total: int, held: admission.Reservation, working: int) -> dict:
+    """
+    Queues `runner` as a job that keeps `held` until it finishes. The job takes
+    its processing slot only once a worker starts it, waiting for one as long
+    as it takes, so queued jobs never occupy slots synchronous requests need.
+    """
+    async def run(context):
+        with held:
+            with await admission.controller.reservation(working).acquire(patient=True):
+                return await runner(context)
+
+    try:
+        job = await jobs.manager.submit(kind, run, total=total)
+    except jobs.JobQueueFull:
+        held.release()
+        raise HTTPException(status_code=503, detail="Job queue is full. Retry later.", headers={"Retry-After": "5"})
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/images/jobs/{job['id']}",
+        "events_url": f"/images/jobs/{job['id']}/events",
+    }
+
+@router.post("/jobs/multicrop", status_code=202)
+async def submit_multicrop_job(
+    file: Optional[UploadFile] = File(None),
+    crops: str = Form(...),
+    source_id: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    speed: Optional[str] = Form(None),
+    thumbnail_widths: Optional[str] = Form(None),
+):
+    """
+    Same input as /multicrop, but returns a job id right away. The crops are
+    encoded and uploaded by a background worker; follow progress with
+    GET /images/jobs/{job_id} or the SSE stream at /images/jobs/{job_id}/events.
+    """
+    parsed_crops = parse_crops_form(crops)
+    widths = parse_thumbnail_widths(thumbnail_widths)
+    # The upload stays in memory until the job is done, so an exhausted byte budget rejects it now
+    held, working = await admit_job(file, source_id)
+    try:
+        source = await read_source(file, source_id)
+        settings = output_settings(output_format, quality, speed, source.format)
+    except BaseException:
+        held.release()
+        raise
+    filename = file.filename if file else source.filename
+
+    async def runner(context):
+        return await run_multicrop(source, parsed_crops, filename, settings, widths, report=context.report)
+
+    return await submit_job("multicrop", runner, len(parsed_crops), held, working)
+
+@router.post("/jobs/auto_crop", status_code=202)
+async def submit_auto_crop_job(
+    file: Optional[UploadFile] = File(None),
+    max_side: int = Form(AUTO_CROP_MAX_SIDE),
+    min_area_ratio: float = Form(detection.DEFAULT_MIN_AREA_RATIO),
+    blur_kernel: int = Form(detection.DEFAULT_BLUR_KERNEL),
+    canny_low: int = Form(detection.DEFAULT_CANNY_LOW),
+    canny_high: int = Form(detection.DEFAULT_CANNY_HIGH),
+    source_id: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    speed: Optional[str] = Form(None),
+):
+    """Same input as /auto_crop, run as a background job (see /jobs/multicrop)."""
+    settings = output_settings(output_format, quality, speed, "JPEG")
+    options = {
+        "max_side": max_side, "min_area_ratio": min_area_ratio, "blur_kernel": blur_kernel,
+        "canny_low": canny_low, "canny_high": canny_high,
+    }
+    held, working = await admit_job(file, source_id, bytes_per_pixel=4)
+    try:
+        source, contents, filename = await read_page_input(file, source_id)
+    except BaseException:
+        held.release()
+        raise
+
+    async def runner(context):
+        context.report("decode", 0, 1)
+        image, digest = await decode_page(source, contents)
+        context.report("decode", 1, 1)
+        return await run_auto_crop(image, digest, filename, options, settings, report=context.report)
+
+    return await submit_job("auto_crop", runner, 0, held, working)
+
+@router.get("/jobs/stats")
+async def job_stats():
+    return jobs.manager.stats()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await jobs.manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events for one job: "status", "progress" (one per encoded or
+    stored crop) and a final "completed" or "failed" event carrying the result.
+    Reconnecting clients resume from their Last-Event-ID.
+    """
+    if await jobs.manager.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    last_event_id = request.headers.get("last-event-id", "")
+    start = int(last_event_id) + 1 if last_event_id.isdigit() else 0
+
+    async def event_stream():
+        index = start
+        while True:
+            events = await jobs.manager.store.events_since(job_id, index)
+            for event in events:
+                yield f"id: {index}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                index += 1
+                if event["type"] in jobs.FINISHED:
+                    return
+            if not await jobs.manager.store.wait_for_event(job_id, index, timeout=15):
+                if await jobs.manager.store.get(job_id) is None:
+                    return
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
@@ -12,3 +12,61 @@ SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "Images")
 # MongoDB Configuration
 MONGODB_URI = os.getenv("MONGODB_URI", "")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "pdftoppt")
+# Connection pool sizing and timeouts for the shared async client
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "60000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "10000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "30000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+# Documents per insert_many/bulk_write call in the bulk question endpoints
+MONGODB_BULK_CHUNK_SIZE = int(os.getenv("MONGODB_BULK_CHUNK_SIZE", "500"))
+
+# /questions listing
+# Largest page a client may request with ?limit=
+QUESTIONS_MAX_PAGE_SIZE = int(os.getenv("QUESTIONS_MAX_PAGE_SIZE", "1000"))
+# Documents fetched per cursor round trip
+QUESTIONS_CURSOR_BATCH_SIZE = int(os.getenv("QUESTIONS_CURSOR_BATCH_SIZE", "500"))
+# Cached /questions responses: total body bytes kept (0 disables) and max age. The TTL bounds
+# staleness when several instances serve the same database, since writes only invalidate locally.
+QUESTIONS_CACHE_MAX_BYTES = int(os.getenv("QUESTIONS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+QUESTIONS_CACHE_TTL_SECONDS = float(os.getenv("QUESTIONS_CACHE_TTL_SECONDS", "30"))
+
+# Image processing
+# Worker threads used to crop/encode regions off the event loop (0 = one per core)
+CROP_MAX_WORKERS = int(os.getenv("CROP_MAX_WORKERS", "0")) or (os.cpu_count() or 1)
+# PDF ingestion: rasterizing worker processes (0 = one per core) and the DPI range allowed
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", "0")) or (os.cpu_count() or 1)
+PDF_DEFAULT_DPI = int(os.getenv("PDF_DEFAULT_DPI", "150"))
+PDF_MAX_DPI = int(os.getenv("PDF_MAX_DPI", "600"))
+# Decoded source images kept for /images/sources: total pixel-memory budget and max age
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_CACHE_TTL_SECONDS = float(os.getenv("IMAGE_CACHE_TTL_SECONDS", "900"))
+# Longest side of the proxy image auto-crop detection runs on (0 = full resolution)
+AUTO_CROP_MAX_SIDE = int(os.getenv("AUTO_CROP_MAX_SIDE", "1600"))
+# Default crop encoding (see app/services/encoding.py): output format, speed preset and lossy qualities
+CROP_OUTPUT_FORMAT = os.getenv("CROP_OUTPUT_FORMAT", "original")
+CROP_OUTPUT_SPEED = os.getenv("CROP_OUTPUT_SPEED", "balanced")
+CROP_JPEG_QUALITY = int(os.getenv("CROP_JPEG_QUALITY", "85"))
+CROP_WEBP_QUALITY = int(os.getenv("CROP_WEBP_QUALITY", "80"))
+# Derivative widths made alongside every multicrop crop, e.g. "256,768" (empty = none)
+CROP_THUMBNAIL_WIDTHS = os.getenv("CROP_THUMBNAIL_WIDTHS", "")
+# Admission control for the image endpoints: requests decoding/encoding at once (0 = two per
+# core), estimated pixel memory they may hold together, and how many may wait (and for how
+# many seconds) before new ones get 503
+IMAGE_MAX_CONCURRENT = int(os.getenv("IMAGE_MAX_CONCURRENT", "0")) or 2 * (os.cpu_count() or 1)
+IMAGE_MEMORY_BUDGET_BYTES = int(os.getenv("IMAGE_MEMORY_BUDGET_BYTES", str(1024 * 1024 * 1024)))
+IMAGE_ADMISSION_QUEUE_SIZE = int(os.getenv("IMAGE_ADMISSION_QUEUE_SIZE", "32"))
+IMAGE_ADMISSION_TIMEOUT_SECONDS = float(os.getenv("IMAGE_ADMISSION_TIMEOUT_SECONDS", "10"))
+
+# Background jobs: concurrent jobs, queued jobs accepted, and how long finished jobs are kept
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+# Storage uploads
+# Maximum number of uploads in flight (also the size of the pooled HTTP connection set)
+SUPABASE_UPLOAD_CONCURRENCY = int(os.getenv("SUPABASE_UPLOAD_CONCURRENCY", "8"))
+SUPABASE_UPLOAD_TIMEOUT = float(os.getenv("SUPABASE_UPLOAD_TIMEOUT", "30"))
+# Storage keys remembered in-process before falling back to the MongoDB index
+STORAGE_INDEX_CACHE_SIZE = int(os.getenv("STORAGE_INDEX_CACHE_SIZE", "10000"))
@@ -1,50 +1,188 @@
-from pymongo import MongoClient
-from app.config import MONGODB_URI, MONGODB_DB_NAME
+from typing import Optional
+from pymongo import AsyncMongoClient, ASCENDING
 from pymongo.server_api import ServerApi
+from app.config import (
+    MONGODB_URI,
+    MONGODB_DB_NAME,
+    MONGODB_MAX_POOL_SIZE,
+    MONGODB_MIN_POOL_SIZE,
+    MONGODB_MAX_IDLE_TIME_MS,
+    MONGODB_CONNECT_TIMEOUT_MS,
+    MONGODB_SOCKET_TIMEOUT_MS,
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+)
+from app.utils import metrics
+import time
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def test_connection():
+# Shared, pooled client. Created by connect() in the app lifespan, or lazily on
+# first use when the lifespan hook does not run (e.g. some serverless runtimes).
+_client: Optional[AsyncMongoClient] = None
+
+def get_client() -> AsyncMongoClient:
+    global _client
+    if _client is None:
+        _client = AsyncMongoClient(
+            MONGODB_URI,
+            server_api=ServerApi('1'),
+            maxPoolSize=MONGODB_MAX_POOL_SIZE,
+            minPoolSize=MONGODB_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+            connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        )
+        logger.info(f"Created MongoDB client for database: {MONGODB_DB_NAME}")
+    return _client
+
+async def connect():
+    """Creates the shared client; called from the app lifespan on startup."""
+    get_client()
+
+async def close():
+    """Closes the shared client and its connection pool on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        logger.info("MongoDB client closed")
+
+async def test_connection():
     try:
-        # Create MongoDB client with server API
-        client = MongoClient(MONGODB_URI, server_api=ServerApi('1'))
-        # Send a ping to confirm a successful connection
-        client.admin.command('ping')
+        # Send a ping over the shared pool to confirm a successful connection
+        await get_client().admin.command('ping')
         logger.info("MongoDB connection successful!")
         return True, "Successfully connected to MongoDB!"
     except Exception as e:
         logger.error(f"MongoDB connection failed: {str(e)}")
         return False, f"Failed to connect to MongoDB: {str(e)}"
 
-# Create MongoDB client
-try:
-    client = MongoClient(MONGODB_URI, server_api=ServerApi('1'))
-    # Get database
-    db = client[MONGODB_DB_NAME]
-    logger.info(f"Connected to database: {MONGODB_DB_NAME}")
-except Exception as e:
-    logger.error(f"Failed to connect to MongoDB: {str(e)}")
-    raise e
-
 # Function to get database instance
 def get_database():
-    return db
+    return get_client()[MONGODB_DB_NAME]
+
+class InstrumentedCursor:
+    """
+    Wraps an async cursor so the time spent fetching documents is recorded as
+    one db stage per query: the fetch time is summed and recorded once, when
+    the cursor is exhausted or closed.
+    """
+
+    def __init__(self, cursor, stage_name: str):
+        self._cursor = cursor
+        self._stage_name = stage_name
+        self._elapsed = 0.0
+        self._recorded = False
+
+    def _record(self):
+        if not self._recorded:
+            self._recorded = True
+            metrics.record_stage(self._stage_name, self._elapsed)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if name in ("sort", "limit", "skip", "batch_size", "hint"):
+            def chain(*args, **kwargs):
+                attribute(*args, **kwargs)
+                return self
+            return chain
+        return attribute
+
+    def __aiter__(self):
+        self._cursor = self._cursor.__aiter__()
+        return self
+
+    async def __anext__(self):
+        started = time.perf_counter()
+        try:
+            document = await self._cursor.__anext__()
+        except Exception:
+            # StopAsyncIteration once exhausted, or a failed fetch: the query is over either way
+            self._elapsed += time.perf_counter() - started
+            self._record()
+            raise
+        self._elapsed += time.perf_counter() - started
+        return document
+
+    async def to_list(self, length=None):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.to_list(length)
+        finally:
+            self._elapsed += time.perf_counter() - started
+            self._record()
+
+    async def close(self):
+        self._record()
+        await self._cursor.close()
+
+
+class InstrumentedCollection:
+    """
+    Thin proxy over an async collection that counts every operation and times
+    it as a "db.<operation>" stage (Server-Timing header and /metrics).
+    """
+    CURSOR_OPERATIONS = ("find",)
+    TIMED_OPERATIONS = (
+        "find_one", "insert_one", "insert_many", "update_one", "update_many", "bulk_write",
+        "find_one_and_update", "delete_one", "delete_many", "count_documents", "create_index",
+    )
+
+    def __init__(self, collection, name: str):
+        self._collection = collection
+        self._name = name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name in self.CURSOR_OPERATIONS:
+            def open_cursor(*args, **kwargs):
+                metrics.DB_OPERATIONS.inc(collection=self._name, operation=name)
+                return InstrumentedCursor(attribute(*args, **kwargs), f"db.{name}")
+            return open_cursor
+        if name == "aggregate":
+            # The async driver returns the aggregation cursor from a coroutine
+            async def open_aggregate(*args, **kwargs):
+                metrics.DB_OPERATIONS.inc(collection=self._name, operation=name)
+                with metrics.stage("db.aggregate"):
+                    cursor = await attribute(*args, **kwargs)
+                return InstrumentedCursor(cursor, "db.aggregate")
+            return open_aggregate
+        if name in self.TIMED_OPERATIONS:
+            async def timed(*args, **kwargs):
+                metrics.DB_OPERATIONS.inc(collection=self._name, operation=name)
+                with metrics.stage(f"db.{name}"):
+                    return await attribute(*args, **kwargs)
+            return timed
+        return attribute
+
 
 # Function to get a specific collection
 def get_collection(collection_name: str):
     try:
-        collection = db[collection_name]
-        logger.info(f"Accessing collection: {collection_name}")
+        collection = InstrumentedCollection(get_database()[collection_name], collection_name)
+        logger.debug(f"Accessing collection: {collection_name}")
         return collection
     except Exception as e:
         logger.error(f"Error accessing collection {collection_name}: {str(e)}")
         raise e
 
-# print(get_collection("questions"))
-
-# Test connection on module import
-# message = get_collection("questions")
-# print(message)    
\ No newline at end of file
+async def ensure_indexes():
+    """
+    Creates the indexes used by the /questions routes. create_index is a no-op
+    when the index already exists, so this is safe to run on every startup.
+    """
+    questions = get_collection("questions")
+    # Serves file_name filters and their _id-ordered pagination
+    await questions.create_index([("file_name", ASCENDING), ("_id", ASCENDING)], name="file_name_id")
+    # Serves /questions/{question_id} lookups and the duplicate check on create
+    await questions.create_index([("question_id", ASCENDING)], name="question_id")
+    # Serves the /questions/summary aggregation: file_name match plus its group-order sort
+    await questions.create_index(
+        [("file_name", ASCENDING), ("section_name", ASCENDING), ("subject", ASCENDING)],
+        name="file_name_section_subject",
+    )
+    logger.info("MongoDB indexes ensured")
@@ -1,17 +1,94 @@
 # backend/app/main.py
-from fastapi import FastAPI, Body, HTTPException
+from app.utils import startup
+from fastapi import FastAPI, Body, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import images
+from app.services import question_summary, questions_cache
+from app import database
+from app.utils import metrics
 from app.database import test_connection, get_database, get_collection
-from fastapi.responses import JSONResponse
-from typing import List, Dict, Any
+from app.config import QUESTIONS_MAX_PAGE_SIZE, QUESTIONS_CURSOR_BATCH_SIZE, MONGODB_BULK_CHUNK_SIZE
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from contextlib import asynccontextmanager
+from starlette.datastructures import MutableHeaders
+from typing import List, Dict, Any, Optional
+import json
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="MultiCrop Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled MongoDB client for the lifetime of the app
+    with startup.timed("init", "mongodb.connect"):
+        await database.connect()
+    try:
+        with startup.timed("init", "mongodb.ensure_indexes"):
+            await database.ensure_indexes()
+    except Exception as e:
+        # Indexes only speed up queries; never block startup on them
+        logger.error(f"Failed to create MongoDB indexes: {str(e)}")
+    yield
+    await database.close()
+
+app = FastAPI(title="MultiCrop Backend", lifespan=lifespan)
+
+class ServerTimingMiddleware:
+    """
+    Times every HTTP request: the total and the stages recorded with
+    metrics.stage() go into a `Server-Timing` response header, and the request
+    duration is observed per route template for GET /metrics.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = metrics.start_request_timing()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total = ("total", time.perf_counter() - started)
+                MutableHeaders(scope=message).append("Server-Timing", metrics.server_timing_header(timings + [total]))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route_template(scope),
+                status=str(status),
+            )
+
+def route_template(scope) -> str:
+    """
+    The matched route's path template (e.g. "/questions/{question_id}") so ids
+    don't explode the metric label set. Routes of an included router may only
+    know their own path, so the router prefix is recovered from the request path.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    path = scope["path"]
+    if not route.path_regex.match(path):
+        for start in range(1, len(path)):
+            if path[start] == "/" and route.path_regex.match(path[start:]):
+                return path[:start] + route.path
+    return route.path
 
 # Configure CORS
 import os
@@ -40,15 +117,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to MultiCrop API", "status": "running"}
 
+@app.get("/startup")
+async def startup_report():
+    """
+    Cold-start cost of this process: app import time, each deferred library
+    import and init step (with when it happened), and which heavy libraries
+    are loaded so far.
+    """
+    return startup.report()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Request, stage, storage and database metrics in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/test-db")
 async def test_db():
-    success, message = test_connection()
+    success, message = await test_connection()
     if not success:
         raise HTTPException(status_code=500, detail=message)
     return {
@@ -56,42 +149,161 @@ async def test_db():
         "message": message,
     }
 
+def serialize_question(question: Dict[Any, Any]) -> str:
+    """Serializes one question document to JSON (ObjectId and other BSON types become strings)."""
+    return json.dumps(question, default=str)
+
+def build_questions_query(file_name: Optional[str], after: Optional[str]) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    # If file_name is provided, filter by it
+    if file_name:
+        query["file_name"] = file_name
+    # Cursor-based pagination: continue after the last _id of the previous page
+    if after:
+        if not ObjectId.is_valid(after):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$gt": ObjectId(after)}
+    return query
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def build_projection(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    # _id is always returned; it is the pagination cursor
+    if not fields:
+        return None
+    return {field.strip(): 1 for field in fields.split(",") if field.strip()}
+
 @app.get("/questions")
-async def get_all_questions(file_name: str = None):
+async def get_all_questions(
+    file_name: str = None,
+    limit: Optional[int] = Query(None, ge=1),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Lists questions, optionally filtered by file_name.
+
+    - limit/after: cursor pagination ordered by _id. Pass the returned
+      "next_cursor" as "after" to fetch the next page. Without limit every
+      matching question is returned.
+    - fields: comma-separated projection, e.g. "question_number,question_image".
+    - stream: respond with NDJSON (one question per line) serialized straight
+      off the cursor instead of one JSON body.
+
+    Full listings (no limit/after/stream) are served from an in-process
+    cache with an ETag; a matching If-None-Match gets 304 Not Modified.
+    Question writes through this API invalidate the affected entries.
+    """
     try:
+        cache_key = None
+        generation = None
+        if limit is None and not after and not stream:
+            cache_key = (file_name or None, fields or None)
+            cached = questions_cache.cache.get(cache_key)
+            if cached is not None:
+                headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+                if etag_matches(if_none_match, cached.etag):
+                    questions_cache.cache.record_not_modified()
+                    metrics.QUESTIONS_CACHE_REQUESTS.inc(result="not_modified")
+                    return Response(status_code=304, headers=headers)
+                metrics.QUESTIONS_CACHE_REQUESTS.inc(result="hit")
+                return Response(content=cached.body, media_type="application/json", headers=headers)
+            metrics.QUESTIONS_CACHE_REQUESTS.inc(result="miss")
+            # Read before the query so a write landing mid-scan keeps this body out of the cache
+            generation = questions_cache.cache.generation
+
         collection = get_collection("questions")
-        logger.info("Fetching questions")
-        
-        # If file_name is provided, filter by it
-        query = {}
-        if file_name:
-            query["file_name"] = file_name
-            logger.info(f"Filtering questions by file_name: {file_name}")
-        
-        questions = list(collection.find(query))
-        
-        # Convert ObjectId to string for JSON serialization
-        for question in questions:
-            if "_id" in question:
-                question["_id"] = str(question["_id"])
-        
+        logger.info(f"Fetching questions (file_name={file_name}, limit={limit}, after={after}, stream={stream})")
+
+        query = build_questions_query(file_name, after)
+        if limit is not None:
+            limit = min(limit, QUESTIONS_MAX_PAGE_SIZE)
+        cursor = collection.find(query, build_projection(fields), batch_size=QUESTIONS_CURSOR_BATCH_SIZE)
+        if limit is not None or after:
+            cursor = cursor.sort("_id", 1)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+
+        if stream:
+            async def ndjson_lines():
+                try:
+                    async for question in cursor:
+                        yield serialize_question(question) + "\n"
+                finally:
+                    await cursor.close()
+            return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+        questions = []
+        ids = []
+        last_id = None
+        async for question in cursor:
+            last_id = question.get("_id")
+            ids.append(str(last_id))
+            questions.append(serialize_question(question))
+        next_cursor = None
+        if limit is not None and len(questions) == limit:
+            next_cursor = str(last_id)
+
         logger.info(f"Found {len(questions)} questions")
-        return {"questions": questions}
+        body = '{"questions": [' + ", ".join(questions) + "]"
+        if limit is not None:
+            body += ', "next_cursor": ' + json.dumps(next_cursor)
+        content = (body + "}").encode()
+        if cache_key is None:
+            return Response(content=content, media_type="application/json")
+        etag = questions_cache.cache.put(cache_key, content, ids, generation)
+        return Response(content=content, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching questions: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Add API prefix routes for compatibility
 @app.get("/api/questions")
-async def get_all_questions_api(file_name: str = None):
-    return await get_all_questions(file_name)
+async def get_all_questions_api(
+    file_name: str = None,
+    limit: Optional[int] = Query(None, ge=1),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    if_none_match: Optional[str] = Header(None),
+):
+    return await get_all_questions(file_name, limit, after, fields, stream, if_none_match)
+
+@app.get("/questions/cache/stats")
+async def questions_cache_stats():
+    """Size and hit rate of the /questions response cache."""
+    return questions_cache.cache.stats()
+
+@app.get("/questions/summary")
+async def get_questions_summary(file_name: Optional[str] = None):
+    """
+    Question counts per file, section and subject (with/without question
+    images, option images, answered), aggregated by MongoDB so dashboards
+    never download the questions themselves. `file_name` limits it to one file.
+    """
+    try:
+        collection = get_collection("questions")
+        cursor = await collection.aggregate(question_summary.summary_pipeline(file_name))
+        rows = await cursor.to_list(None)
+        return question_summary.shape_summary(rows)
+    except Exception as e:
+        logger.error(f"Error summarizing questions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/questions/{question_id}")
 async def get_question_by_id(question_id: str):
     try:
         collection = get_collection("questions")
         logger.info(f"Fetching question with ID: {question_id}")
-        question = collection.find_one({"question_id": question_id}, {'_id': 0})
+        question = await collection.find_one({"question_id": question_id}, {'_id': 0})
         if not question:
             logger.warning(f"Question not found with ID: {question_id}")
             raise HTTPException(status_code=404, detail="Question not found")
@@ -108,9 +320,10 @@ async def create_question(question: Dict[Any, Any] = Body(...)):
         collection = get_collection("questions")
         logger.info("Creating new question")
         # Check if question_id already exists
-        if "question_id" in question and collection.find_one({"question_id": question["question_id"]}):
+        if "question_id" in question and await collection.find_one({"question_id": question["question_id"]}):
             raise HTTPException(status_code=400, detail="Question ID already exists")
-        result = collection.insert_one(question)
+        result = await collection.insert_one(question)
+        questions_cache.cache.invalidate(file_names=[question.get("file_name")])
         logger.info(f"Question created with ID: {result.inserted_id}")
         return JSONResponse(
             status_code=201,
@@ -122,28 +335,168 @@ async def create_question(question: Dict[Any, Any] = Body(...)):
         logger.error(f"Error creating question: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def chunked(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+def get_field(document: Dict[Any, Any], path: str) -> Any:
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return None
+    return value
+
+def write_error_messages(error: BulkWriteError) -> Dict[int, str]:
+    """Maps operation index (within the failed batch) to its error message."""
+    return {err["index"]: err.get("errmsg", "Write error") for err in error.details.get("writeErrors", [])}
+
 @app.post("/questions/bulk")
-async def create_many_questions(questions: List[Dict[Any, Any]] = Body(...)):
+async def create_many_questions(
+    questions: List[Dict[Any, Any]] = Body(...),
+    chunk_size: Optional[int] = Query(None, ge=1),
+):
+    """
+    Inserts questions in unordered chunks of `chunk_size` (MONGODB_BULK_CHUNK_SIZE
+    by default). A failing document does not stop the others; every item gets a
+    result with its inserted id or its error.
+    """
     try:
         collection = get_collection("questions")
-        logger.info(f"Creating {len(questions)} questions")
-        result = collection.insert_many(questions)
-        logger.info(f"Successfully inserted {len(result.inserted_ids)} questions")
+        chunk_size = chunk_size or MONGODB_BULK_CHUNK_SIZE
+        logger.info(f"Creating {len(questions)} questions in chunks of {chunk_size}")
+
+        results = []
+        for start, chunk in chunked(questions, chunk_size):
+            errors = {}
+            try:
+                await collection.insert_many(chunk, ordered=False)
+            except BulkWriteError as e:
+                errors = write_error_messages(e)
+            for offset, question in enumerate(chunk):
+                if offset in errors:
+                    results.append({"index": start + offset, "inserted_id": None, "error": errors[offset]})
+                else:
+                    results.append({"index": start + offset, "inserted_id": str(question["_id"]), "error": None})
+
+        questions_cache.cache.invalidate(file_names={question.get("file_name") for question in questions})
+        inserted_ids = [result["inserted_id"] for result in results if result["error"] is None]
+        failed_count = len(results) - len(inserted_ids)
+        logger.info(f"Successfully inserted {len(inserted_ids)} questions ({failed_count} failed)")
         return JSONResponse(
-            status_code=201,
+            status_code=201 if failed_count == 0 else 207,
             content={
-                "message": f"Successfully inserted {len(result.inserted_ids)} questions",
-                "inserted_ids": [str(id) for id in result.inserted_ids]
+                "message": f"Successfully inserted {len(inserted_ids)} questions",
+                "inserted_ids": inserted_ids,
+                "failed_count": failed_count,
+                "results": results,
             }
         )
     except Exception as e:
         logger.error(f"Error creating questions in bulk: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.put("/questions/bulk")
+async def update_many_questions(
+    patches: List[Dict[Any, Any]] = Body(...),
+    chunk_size: Optional[int] = Query(None, ge=1),
+):
+    """
+    Applies many question edits at once. The body is a list of
+    {"_id": "<question ObjectId>", "fields": {...}} patches; each chunk of
+    `chunk_size` patches is sent as a single unordered bulk_write.
+
+    Every patch gets a result with "matched" (the question exists), "modified"
+    (at least one field actually changed) and "error". Per-item flags are
+    computed from one projected read of the chunk before the write; the
+    top-level counts come from MongoDB itself.
+    """
+    try:
+        collection = get_collection("questions")
+        chunk_size = chunk_size or MONGODB_BULK_CHUNK_SIZE
+        logger.info(f"Bulk updating {len(patches)} questions in chunks of {chunk_size}")
+
+        results: List[Dict[str, Any]] = []
+        valid = []
+        for index, patch in enumerate(patches):
+            result = {"index": index, "_id": patch.get("_id"), "matched": False, "modified": False, "error": None}
+            results.append(result)
+            fields = patch.get("fields")
+            if not ObjectId.is_valid(str(patch.get("_id"))):
+                result["error"] = "Invalid _id"
+            elif not isinstance(fields, dict) or not fields:
+                result["error"] = "fields must be a non-empty object"
+            else:
+                fields = {key: value for key, value in fields.items() if key != "_id"}
+                valid.append((result, ObjectId(str(patch["_id"])), fields))
+
+        matched_count = 0
+        modified_count = 0
+        for _, chunk in chunked(valid, chunk_size):
+            # One projected read tells which patches match and which would change anything
+            roots = {key.split(".")[0] for _, _, fields in chunk for key in fields}
+            current = {
+                document["_id"]: document
+                async for document in collection.find(
+                    {"_id": {"$in": [object_id for _, object_id, _ in chunk]}},
+                    {root: 1 for root in roots},
+                )
+            }
+
+            errors = {}
+            try:
+                write = await collection.bulk_write(
+                    [UpdateOne({"_id": object_id}, {"$set": fields}) for _, object_id, fields in chunk],
+                    ordered=False,
+                )
+                matched_count += write.matched_count
+                modified_count += write.modified_count
+            except BulkWriteError as e:
+                errors = write_error_messages(e)
+                matched_count += e.details.get("nMatched", 0)
+                modified_count += e.details.get("nModified", 0)
+
+            for offset, (result, object_id, fields) in enumerate(chunk):
+                if offset in errors:
+                    result["error"] = errors[offset]
+                    continue
+                document = current.get(object_id)
+                if document is None:
+                    result["error"] = "Question not found"
+                    continue
+                result["matched"] = True
+                result["modified"] = any(get_field(document, key) != value for key, value in fields.items())
+
+        questions_cache.cache.invalidate(
+            file_names={fields["file_name"] for _, _, fields in valid if "file_name" in fields},
+            ids=[object_id for _, object_id, _ in valid],
+        )
+        logger.info(f"Bulk update matched {matched_count}, modified {modified_count} questions")
+        return {
+            "message": f"Updated {modified_count} of {len(patches)} questions",
+            "matched_count": matched_count,
+            "modified_count": modified_count,
+            "failed_count": sum(1 for result in results if result["error"]),
+            "results": results,
+        }
+    except Exception as e:
+        logger.error(f"Error bulk updating questions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Add API prefix routes for compatibility
+@app.put("/api/questions/bulk")
+async def update_many_questions_api(
+    patches: List[Dict[Any, Any]] = Body(...),
+    chunk_size: Optional[int] = Query(None, ge=1),
+):
+    return await update_many_questions(patches, chunk_size)
+
 @app.put("/questions/{question_id}")
 async def update_question(question_id: str, question_data: Dict[Any, Any] = Body(...)):
     try:
-        from bson import ObjectId
         collection = get_collection("questions")
         logger.info(f"Updating question with ID: {question_id}")
         
@@ -154,16 +507,20 @@ async def update_question(question_id: str, question_data: Dict[Any, Any] = Body
         if "_id" in question_data:
             del question_data["_id"]
         
-        result = collection.update_one(
+        result = await collection.update_one(
             {"_id": object_id},
             {"$set": question_data}
         )
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Question not found")
+        # Entries holding this question, and its new file_name's listing if it moved
+        questions_cache.cache.invalidate(file_names=[question_data.get("file_name")], ids=[object_id])
         
         logger.info(f"Question {question_id} updated successfully")
         return {"message": "Question updated successfully", "modified_count": result.modified_count}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating question {question_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -176,6 +533,8 @@ async def update_question_api(question_id: str, question_data: Dict[Any, Any] =
 # Include image endpoints with a prefix and tag.
 app.include_router(images.router, prefix="/images", tags=["images"])
 
+startup.record("import", "app.main", time.perf_counter() - startup.IMPORT_STARTED)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
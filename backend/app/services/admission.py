@@ -0,0 +1,188 @@
+# backend/app/services/admission.py
+"""
+Admission control for the CPU- and memory-heavy image endpoints.
+
+Every admitted request holds one of IMAGE_MAX_CONCURRENT slots plus an
+estimate of the memory it will need: its encoded bytes and the decoded
+pixels, estimated from the image header before anything is read in full or
+decoded. A request that does not fit waits in a FIFO queue; when the queue
+is full, or the wait exceeds IMAGE_ADMISSION_TIMEOUT_SECONDS, it is
+rejected with Saturated (answered as 503 + Retry-After by the router).
+
+A single request larger than the whole budget is admitted on its own rather
+than rejected forever.
+
+Background jobs split their reservation: the bytes of the upload they hold
+are reserved without a slot when the job is submitted, and the slot (with
+the decoding estimate) is taken only when a job worker starts the job, so
+queued jobs never keep synchronous requests from being admitted.
+"""
+import asyncio
+import math
+from collections import deque
+from typing import BinaryIO, Deque, Optional, Tuple
+
+from app.config import (
+    IMAGE_ADMISSION_QUEUE_SIZE,
+    IMAGE_ADMISSION_TIMEOUT_SECONDS,
+    IMAGE_MAX_CONCURRENT,
+    IMAGE_MEMORY_BUDGET_BYTES,
+)
+from app.utils import metrics
+from app.utils.startup import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+
+class Saturated(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__("Server is busy processing images. Retry later.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Reservation:
+    """
+    One request's slot and bytes (just bytes when `slot` is False).
+    release() is idempotent; `with reservation:` releases on exit.
+    """
+
+    def __init__(self, controller: "AdmissionController", nbytes: int, slot: bool = True):
+        self.controller = controller
+        self.nbytes = nbytes
+        self.slot = slot
+        self.patient = False
+        self.held = False
+
+    async def acquire(self, patient: bool = False) -> "Reservation":
+        """
+        Waits for admission. A patient reservation (a background job, with no
+        client to time out) waits as long as it takes and is not counted
+        against the queue size.
+        """
+        self.patient = patient
+        await self.controller._acquire(self)
+        return self
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.controller._release(self)
+
+    def __enter__(self) -> "Reservation":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_bytes: int, queue_size: int, timeout_seconds: float):
+        self.max_concurrent = max_concurrent
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.timeout_seconds = timeout_seconds
+        self.in_flight = 0
+        self.reserved_bytes = 0
+        self._waiters: Deque[Tuple[asyncio.Future, Reservation]] = deque()
+
+    def reservation(self, nbytes: int, slot: bool = True) -> Reservation:
+        return Reservation(self, min(max(0, nbytes), self.max_bytes), slot)
+
+    def _fits(self, reservation: Reservation) -> bool:
+        if reservation.slot and self.in_flight >= self.max_concurrent:
+            return False
+        return self.reserved_bytes == 0 or self.reserved_bytes + reservation.nbytes <= self.max_bytes
+
+    def _take(self, reservation: Reservation):
+        if reservation.slot:
+            self.in_flight += 1
+        self.reserved_bytes += reservation.nbytes
+        reservation.held = True
+        self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+        metrics.ADMISSION_RESERVED_BYTES.set(self.reserved_bytes)
+        metrics.ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+
+    def _wake(self):
+        # Strictly FIFO: a large request at the head is not overtaken by smaller ones behind it
+        while self._waiters and self._fits(self._waiters[0][1]):
+            waiter, reservation = self._waiters.popleft()
+            if not waiter.done():
+                self._take(reservation)
+                waiter.set_result(None)
+        self._update_gauges()
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.timeout_seconds))
+
+    async def _acquire(self, reservation: Reservation):
+        if not self._waiters and self._fits(reservation):
+            self._take(reservation)
+            return
+        queued = sum(1 for _, waiting in self._waiters if not waiting.patient)
+        if not reservation.patient and queued >= self.queue_size:
+            metrics.ADMISSION_REJECTIONS.inc(reason="queue_full")
+            raise Saturated("queue_full", self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, reservation)
+        self._waiters.append(entry)
+        self._update_gauges()
+        try:
+            with metrics.stage("admission_wait"):
+                await asyncio.wait_for(waiter, None if reservation.patient else self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self._forget(entry)
+            metrics.ADMISSION_REJECTIONS.inc(reason="timeout")
+            raise Saturated("timeout", self._retry_after())
+        except asyncio.CancelledError:
+            # Client went away while queued (or right after being admitted)
+            self._forget(entry)
+            reservation.release()
+            raise
+
+    def _forget(self, entry):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+        self._wake()
+
+    def _release(self, reservation: Reservation):
+        if reservation.slot:
+            self.in_flight -= 1
+        self.reserved_bytes -= reservation.nbytes
+        self._wake()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "reserved_bytes": self.reserved_bytes,
+            "max_bytes": self.max_bytes,
+            "queue_depth": len(self._waiters),
+            "queue_size": self.queue_size,
+        }
+
+
+def decoded_size(fileobj: BinaryIO) -> Optional[Tuple[int, int, int]]:
+    """
+    (width, height, bands) from the image header of a seekable upload, without
+    reading the rest of it; None when the header is not an image Pillow knows.
+    """
+    try:
+        fileobj.seek(0)
+        with Image.open(fileobj) as image:
+            width, height = image.size
+            return width, height, len(image.getbands())
+    except Exception:
+        return None
+    finally:
+        fileobj.seek(0)
+
+
+# Process-wide controller shared by the image router
+controller = AdmissionController(
+    IMAGE_MAX_CONCURRENT, IMAGE_MEMORY_BUDGET_BYTES, IMAGE_ADMISSION_QUEUE_SIZE, IMAGE_ADMISSION_TIMEOUT_SECONDS
+)
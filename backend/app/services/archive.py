@@ -0,0 +1,67 @@
+# backend/app/services/archive.py
+"""
+Incremental ZIP writer for streamed responses.
+
+ZipArchive.add() returns the bytes of one entry as soon as it is written and
+close() returns the central directory, so a response can send each crop the
+moment it is encoded and never holds more than one entry (plus the small
+per-entry directory records) in memory. Entries are stored uncompressed:
+crops are already PNG/JPEG/WebP, which deflate would not shrink.
+"""
+import io
+import time
+import zipfile
+from typing import Tuple
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, non-seekable target; zipfile then writes data descriptors instead of seeking back."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipArchive:
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_STORED)
+        self._names = set()
+        self.num_entries = 0
+
+    def _unique_name(self, name: str) -> str:
+        """`name`, or `name` with a " (n)" suffix before the extension if it was already used."""
+        stem, dot, extension = name.rpartition(".")
+        if not dot:
+            stem, extension = name, ""
+        candidate, counter = name, 1
+        while candidate in self._names:
+            counter += 1
+            candidate = f"{stem} ({counter}){dot}{extension}"
+        self._names.add(candidate)
+        return candidate
+
+    def add(self, name: str, data: bytes) -> Tuple[str, bytes]:
+        """Writes one entry; returns the name it was stored under and the bytes to send for it."""
+        info = zipfile.ZipInfo(self._unique_name(name), date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        self._zip.writestr(info, data)
+        self.num_entries += 1
+        return info.filename, self._sink.drain()
+
+    def close(self) -> bytes:
+        """Finishes the archive and returns the trailing central directory."""
+        self._zip.close()
+        return self._sink.drain()
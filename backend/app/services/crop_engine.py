@@ -0,0 +1,297 @@
+# backend/app/services/crop_engine.py
+"""
+Crop/encode engine shared by the image endpoints.
+
+The source image is decoded once; every crop region is then cut and encoded
+on a bounded worker pool so the event loop stays free while Pillow does the
+CPU work (its codecs release the GIL, so threads scale across cores). For
+one-off crops of JPEG and tiled sources, load_region() decodes only the part
+of the image the crops actually cover.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config import CROP_MAX_WORKERS
+from app.services.encoding import OutputSettings
+from app.utils.ingest import BufferReader
+from app.utils.startup import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+Box = Tuple[int, int, int, int]
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the process-wide crop pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CROP_MAX_WORKERS, thread_name_prefix="crop")
+    return _executor
+
+
+async def run_in_pool(func: Callable, *args: Any) -> Any:
+    """Runs a blocking function on the crop pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), func, *args)
+
+
+def parse_crop_boxes(crop_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Validates the crop list sent by the client and normalises each entry to
+    {"index", "name", "box", "target"}. Raises ValueError on missing coordinates.
+
+    "target" is None unless the crop names the question it belongs to
+    ("question_id", plus "type": "question" | "option" and "option_index"
+    for option images).
+    """
+    if not isinstance(crop_data, list):
+        raise ValueError("Crop data must be a list of crop objects.")
+
+    parsed = []
+    for idx, crop in enumerate(crop_data):
+        try:
+            box = (int(crop["left"]), int(crop["top"]), int(crop["right"]), int(crop["bottom"]))
+        except (KeyError, TypeError):
+            raise ValueError("Missing one of [left, top, right, bottom].")
+        except ValueError:
+            raise ValueError("Crop coordinates must be integers.")
+        # Names end up in file names, so null/empty become the default and anything else a string
+        name = crop.get("name")
+        name = f"crop_{idx}" if name is None or name == "" else str(name)
+        parsed.append({"index": idx, "name": name, "box": box, "target": _parse_target(crop)})
+    return parsed
+
+
+def _parse_target(crop: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not crop.get("question_id"):
+        return None
+    kind = crop.get("type", "question")
+    if kind not in ("question", "option"):
+        raise ValueError("Crop type must be 'question' or 'option'.")
+    target = {"question_id": str(crop["question_id"]), "type": kind, "option_index": None}
+    if kind == "option":
+        try:
+            target["option_index"] = int(crop["option_index"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Option crops need an integer 'option_index'.")
+    return target
+
+
+def open_image(image_data: bytes) -> "Image.Image":
+    """Reads only the image header (format, size); pixels are decoded on load()."""
+    return Image.open(BufferReader(image_data))
+
+
+def _stored_format(image_format: str) -> str:
+    # Camera JPEGs with extra frames open as MPO; they are stored as the JPEGs they are
+    return "JPEG" if image_format == "MPO" else image_format
+
+
+def extension_for(image_format: str) -> str:
+    """File extension for a Pillow format name, e.g. "JPEG" (or "MPO") -> ".jpg"."""
+    image_format = _stored_format(image_format)
+    return ".jpg" if image_format == "JPEG" else f".{image_format.lower()}"
+
+
+def content_type_for(image_format: str) -> str:
+    return Image.MIME.get(_stored_format(image_format), "application/octet-stream")
+
+
+def decode_image(image_data: bytes) -> "Image.Image":
+    """Opens and fully decodes an image so it can be shared between workers."""
+    image = Image.open(BufferReader(image_data))
+    image.load()
+    return image
+
+
+def bounding_box(boxes: Sequence[Box]) -> Box:
+    """Smallest box containing every box."""
+    return (
+        min(box[0] for box in boxes), min(box[1] for box in boxes),
+        max(box[2] for box in boxes), max(box[3] for box in boxes),
+    )
+
+
+def region_decodable(image: "Image.Image") -> bool:
+    """
+    True when load_region() can decode part of this (still undecoded) image:
+    a single-tile JPEG (decoded top-down, so it can stop early) or a raster
+    split into several tiles/strips, e.g. a tiled or striped TIFF.
+    """
+    if image.format == "JPEG" and len(image.tile) == 1:
+        return True
+    return len(image.tile) > 1
+
+
+def region_fraction(image: "Image.Image", box: Box) -> float:
+    """Share of the image's pixels load_region() would decode for `box` (1.0 when it cannot decode a region)."""
+    if not region_decodable(image):
+        return 1.0
+    left, top, right, bottom = box
+    if len(image.tile) > 1:
+        area = sum(
+            (x1 - x0) * (y1 - y0)
+            for x0, y0, x1, y1 in (tile.extents for tile in image.tile)
+            if x0 < right and x1 > left and y0 < bottom and y1 > top
+        )
+        return area / (image.width * image.height)
+    return min(1.0, (bottom + 16) / image.height)
+
+
+def load_region(image_data: bytes, box: Box) -> Tuple["Image.Image", Tuple[int, int]]:
+    """
+    Decodes only as much of the image as is needed to cover `box`; returns
+    the decoded part and the offset of its top-left corner in the full image.
+
+    - tiled/striped rasters: only the tiles overlapping `box` are read and
+      decoded, into an image spanning just those tiles.
+    - JPEG: the frame header is rewritten to end just below `box`, so rows
+      under it are never decompressed or stored (rows above still are:
+      JPEG scans can only be decoded from the top).
+    - anything else is decoded whole.
+    """
+    image = Image.open(BufferReader(image_data))
+    left, top, right, bottom = box
+    left, top = max(0, left), max(0, top)
+    right, bottom = min(image.width, right), min(image.height, bottom)
+    if right <= left or bottom <= top or not region_decodable(image):
+        image.load()
+        return image, (0, 0)
+
+    if len(image.tile) > 1:
+        tiles = [
+            tile for tile in image.tile
+            if tile.extents[0] < right and tile.extents[2] > left and tile.extents[1] < bottom and tile.extents[3] > top
+        ]
+        x0, y0, x1, y1 = bounding_box([tile.extents for tile in tiles])
+        image.tile = [
+            tile._replace(extents=(tile.extents[0] - x0, tile.extents[1] - y0, tile.extents[2] - x0, tile.extents[3] - y0))
+            for tile in tiles
+        ]
+        image._size = (x1 - x0, y1 - y0)
+        image.load()
+        return image, (x0, y0)
+
+    # One more MCU row: chroma upsampling of the last rows looks at the row below
+    truncated = _jpeg_with_height(image_data, min(image.height, bottom + 16))
+    if truncated is None:
+        image.load()
+        return image, (0, 0)
+    image = Image.open(BufferReader(truncated))
+    image.load()
+    return image, (0, 0)
+
+
+def _jpeg_with_height(image_data: bytes, height: int) -> Optional[bytes]:
+    """
+    Copy of a JPEG whose frame header declares only the first `height` rows.
+    libjpeg then decodes those rows and skips the rest of each scan, so the
+    pixels below are never decompressed. None if no frame header is found.
+    """
+    position = 2  # after SOI
+    while position + 4 <= len(image_data) and image_data[position] == 0xFF:
+        marker = image_data[position + 1]
+        if marker == 0xDA:  # start of scan before any frame header
+            return None
+        length = int.from_bytes(image_data[position + 2:position + 4], "big")
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            patched = bytearray(image_data)
+            patched[position + 5:position + 7] = height.to_bytes(2, "big")
+            return bytes(patched)
+        position += 2 + length
+    return None
+
+
+def crop_and_encode(image: "Image.Image", box: Box, settings: OutputSettings) -> bytes:
+    """Cuts one region out of a decoded image and encodes it."""
+    return settings.encode(image.crop(box))
+
+
+def downscale(image: "Image.Image", width: int) -> "Image.Image":
+    """
+    Resizes to `width` keeping the aspect ratio. Large factors are first
+    reduced by whole-pixel box averaging (reducing_gap), which is much cheaper
+    than a full-quality resample of every source pixel.
+    """
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.BILINEAR, reducing_gap=2.0)
+
+
+def crop_and_encode_sizes(image: "Image.Image", box: Box, settings: OutputSettings, widths: Sequence[Optional[int]]) -> List[bytes]:
+    """
+    Cuts one region and encodes it once per entry of `widths` (None = full
+    size). Sizes are produced largest first and each smaller one is reduced
+    from the previous level, so the region is only cropped once.
+    """
+    region = image.crop(box)
+    encoded: Dict[Optional[int], bytes] = {}
+    level = region
+    for width in sorted(widths, key=lambda w: region.width if w is None else w, reverse=True):
+        if width is not None and width < level.width:
+            level = downscale(level, width)
+        encoded[width] = settings.encode(level)
+    return [encoded[width] for width in widths]
+
+
+async def crop_many(
+    image: "Image.Image",
+    boxes: List[Box],
+    settings: OutputSettings,
+    on_done: Optional[Callable[[int, int], None]] = None,
+    widths: Optional[List[Sequence[Optional[int]]]] = None,
+) -> List[Any]:
+    """
+    Crops and encodes every box in parallel; results keep the order of `boxes`.
+    `on_done(done, total)` is called as each crop finishes.
+
+    With `widths` (one list per box, see crop_and_encode_sizes) each result is
+    the list of encodings of that box instead of a single one.
+    """
+    done = 0
+
+    async def crop_one(index: int, box: Box):
+        nonlocal done
+        if widths is None:
+            data = await run_in_pool(crop_and_encode, image, box, settings)
+        else:
+            data = await run_in_pool(crop_and_encode_sizes, image, box, settings, widths[index])
+        done += 1
+        if on_done is not None:
+            on_done(done, len(boxes))
+        return data
+
+    return await asyncio.gather(*(crop_one(index, box) for index, box in enumerate(boxes)))
+
+
+async def crop_stream(
+    image: "Image.Image",
+    boxes: List[Box],
+    settings: OutputSettings,
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Crops and encodes every box in parallel and yields (index, data) as each
+    one finishes, in completion order. At most two crops per pool worker are
+    in flight, so a slow consumer (e.g. a client reading a streamed response)
+    holds back encoding instead of letting finished crops pile up in memory.
+    """
+    window = 2 * get_executor()._max_workers
+    pending: Dict[asyncio.Future, int] = {}
+    boxes_left = iter(enumerate(boxes))
+    try:
+        while True:
+            for index, box in boxes_left:
+                pending[asyncio.ensure_future(run_in_pool(crop_and_encode, image, box, settings))] = index
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,234 @@
+# backend/app/services/detection.py
+"""
+Region detection for scanned pages (used by /images/auto_crop).
+
+Contours are searched on a downscaled grayscale proxy of the scan and the
+resulting boxes are mapped back to full resolution, so detection cost and
+behaviour depend on the page, not on the scan DPI. Area thresholds are given
+as a fraction of the page area for the same reason.
+
+arrange_boxes() post-processes boxes that are returned as coordinates (for
+the user to adjust before /images/multicrop): clipped to the page, nested or
+overlapping boxes merged, and sorted in reading order, column by column.
+"""
+import math
+from typing import List, Optional, Tuple
+
+from app.config import AUTO_CROP_MAX_SIDE
+from app.services.encoding import PNG_COMPRESS_LEVELS, OutputSettings
+from app.utils.ingest import BufferReader
+from app.utils.startup import lazy_import
+
+# OpenCV and NumPy load on first detection, not when the API starts
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+# Boxes are (x, y, w, h) in full-resolution pixel coordinates
+Box = Tuple[int, int, int, int]
+
+# Default tuning, exposed as form fields on /images/auto_crop
+DEFAULT_MIN_AREA_RATIO = 0.002  # ~5000 px on a 150-dpi A4 page, the old fixed threshold
+DEFAULT_BLUR_KERNEL = 5
+DEFAULT_CANNY_LOW = 50
+DEFAULT_CANNY_HIGH = 150
+# Box post-processing (arrange_boxes)
+DEFAULT_OVERLAP_THRESHOLD = 0.5   # merge boxes whose IoU, or share of the smaller box covered, exceeds this
+DEFAULT_SPANNING_RATIO = 0.6      # boxes wider than this share of the page span columns (headers, wide figures)
+
+
+def decode_color(contents: bytes) -> "np.ndarray":
+    """Decodes encoded image bytes into a BGR array; raises ValueError when unreadable."""
+    image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid image data.")
+    return image
+
+
+def from_pil(image) -> "np.ndarray":
+    """Converts a decoded Pillow image into the BGR array OpenCV works on."""
+    return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+def gray_from_pil(image) -> "np.ndarray":
+    """Converts a decoded Pillow image into a grayscale array."""
+    return np.asarray(image.convert("L"))
+
+
+def decode_gray_proxy(contents: bytes, max_side: int = AUTO_CROP_MAX_SIDE) -> Tuple["np.ndarray", Tuple[int, int]]:
+    """
+    Decodes encoded image bytes straight to a grayscale array for detection
+    and returns it with the full (width, height). JPEGs are decoded at a
+    reduced DCT scale (1/2 to 1/8) when that still covers `max_side`, so
+    the full-resolution pixels never exist; other formats are decoded whole.
+    """
+    image = Image.open(BufferReader(contents))
+    full_size = image.size
+    if max_side > 0 and max(full_size) > max_side:
+        scale = max_side / max(full_size)
+        image.draft("L", (math.ceil(full_size[0] * scale), math.ceil(full_size[1] * scale)))
+    return np.asarray(image.convert("L")), full_size
+
+
+def detect_regions(
+    image: "np.ndarray",
+    max_side: int = AUTO_CROP_MAX_SIDE,
+    min_area_ratio: float = DEFAULT_MIN_AREA_RATIO,
+    blur_kernel: int = DEFAULT_BLUR_KERNEL,
+    canny_low: int = DEFAULT_CANNY_LOW,
+    canny_high: int = DEFAULT_CANNY_HIGH,
+    full_size: Optional[Tuple[int, int]] = None,
+) -> List[Box]:
+    """
+    Finds document regions in a BGR or grayscale image and returns their
+    bounding boxes at full resolution, largest first. `full_size` (width,
+    height) is the page size when `image` is already a reduced copy of it.
+    """
+    width, height = full_size or (image.shape[1], image.shape[0])
+
+    # 1. Grayscale first, then shrink: both steps get cheaper in this order
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    scale = min(1.0, max_side / max(gray.shape)) if max_side > 0 else 1.0
+    if scale < 1.0:
+        proxy_size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        gray = cv2.resize(gray, proxy_size, interpolation=cv2.INTER_AREA)
+    scale_x, scale_y = gray.shape[1] / width, gray.shape[0] / height
+
+    # 2. Blur to reduce noise (kernel must be odd), then edge detection
+    if blur_kernel > 1:
+        kernel = blur_kernel if blur_kernel % 2 else blur_kernel + 1
+        gray = cv2.GaussianBlur(gray, (kernel, kernel), 0)
+    edges = cv2.Canny(gray, threshold1=canny_low, threshold2=canny_high)
+
+    # 3. Find contours and compute each area exactly once
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_area_ratio * gray.shape[0] * gray.shape[1]
+    candidates = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area > min_area:
+            candidates.append((area, contour))
+
+    # Biggest "documents" first
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    # 4. Map proxy boxes back to full resolution, rounding outwards
+    boxes = []
+    for _, contour in candidates:
+        x, y, w, h = cv2.boundingRect(contour)
+        left = max(0, math.floor(x / scale_x))
+        top = max(0, math.floor(y / scale_y))
+        right = min(width, math.ceil((x + w) / scale_x))
+        bottom = min(height, math.ceil((y + h) / scale_y))
+        boxes.append((left, top, right - left, bottom - top))
+    return boxes
+
+
+def arrange_boxes(
+    boxes: List[Box],
+    width: int,
+    height: int,
+    overlap_threshold: float = DEFAULT_OVERLAP_THRESHOLD,
+    spanning_ratio: float = DEFAULT_SPANNING_RATIO,
+) -> List[Box]:
+    """
+    Clips (x, y, w, h) boxes to the page, merges nested and overlapping ones
+    and returns them in reading order. All steps work on whole arrays.
+    """
+    if not boxes:
+        return []
+    xywh = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    corners = np.column_stack((xywh[:, :2], xywh[:, :2] + xywh[:, 2:]))
+
+    # 1. Clip to the page and drop boxes left empty
+    corners = np.clip(corners, 0, [width, height, width, height])
+    corners = corners[(corners[:, 2] > corners[:, 0]) & (corners[:, 3] > corners[:, 1])]
+
+    corners = merge_overlapping(corners, overlap_threshold)
+    order = reading_order(corners, width, spanning_ratio)
+    return [(int(x0), int(y0), int(x1 - x0), int(y1 - y0)) for x0, y0, x1, y1 in corners[order]]
+
+
+def merge_overlapping(corners: "np.ndarray", overlap_threshold: float) -> "np.ndarray":
+    """
+    Non-maximum suppression over (x0, y0, x1, y1) rows, largest first: a box
+    whose IoU with a kept box, or whose own area covered by it, exceeds
+    `overlap_threshold` is merged into that box (which grows to their union).
+    """
+    areas = (corners[:, 2] - corners[:, 0]) * (corners[:, 3] - corners[:, 1])
+    order = np.argsort(-areas, kind="stable")
+    corners, areas = corners[order], areas[order]
+
+    # Pairwise intersections in one pass
+    overlap_w = np.clip(np.minimum(corners[:, None, 2], corners[None, :, 2]) - np.maximum(corners[:, None, 0], corners[None, :, 0]), 0, None)
+    overlap_h = np.clip(np.minimum(corners[:, None, 3], corners[None, :, 3]) - np.maximum(corners[:, None, 1], corners[None, :, 1]), 0, None)
+    intersection = overlap_w * overlap_h
+    union = areas[:, None] + areas[None, :] - intersection
+    covered = intersection / np.minimum(areas[:, None], areas[None, :])
+    merge = (intersection / union > overlap_threshold) | (covered > overlap_threshold)
+
+    alive = np.ones(len(corners), dtype=bool)
+    kept = []
+    for index in range(len(corners)):
+        if not alive[index]:
+            continue
+        group = alive & merge[index]
+        group[index] = True
+        alive &= ~group
+        members = corners[group]
+        kept.append((members[:, 0].min(), members[:, 1].min(), members[:, 2].max(), members[:, 3].max()))
+    return np.asarray(kept, dtype=np.int64).reshape(-1, 4)
+
+
+def reading_order(corners: "np.ndarray", width: int, spanning_ratio: float) -> "np.ndarray":
+    """
+    Indices of (x0, y0, x1, y1) rows in reading order. Columns are found by
+    sweeping the narrow boxes left to right: a new column starts where a box
+    begins right of every box before it. Boxes spanning columns (wider than
+    `spanning_ratio` of the page) split the page into bands; each band is
+    read column by column, top to bottom, after the spanning box above it.
+    """
+    if len(corners) == 0:
+        return np.zeros(0, dtype=np.int64)
+    x0, y0, x1 = corners[:, 0], corners[:, 1], corners[:, 2]
+    spanning = (x1 - x0) > spanning_ratio * width
+
+    # Columns of the narrow boxes (a little overlap between neighbours is tolerated)
+    column = np.zeros(len(corners), dtype=np.int64)
+    narrow = np.flatnonzero(~spanning)
+    if len(narrow):
+        by_left = narrow[np.argsort(x0[narrow], kind="stable")]
+        reach = np.maximum.accumulate(x1[by_left])
+        tolerance = 0.02 * width
+        starts = x0[by_left][1:] >= reach[:-1] - tolerance
+        column[by_left] = np.concatenate(([0], np.cumsum(starts)))
+
+    # Bands: everything below a spanning box's top (and above the next one's) reads after it
+    band = np.searchsorted(np.sort(y0[spanning]), y0, side="right")
+    # np.lexsort sorts by the last key first
+    return np.lexsort((x0, y0, column, ~spanning, band))
+
+
+def imencode_params(settings: OutputSettings) -> List[int]:
+    """OpenCV imencode flags matching the Pillow save options of `settings`."""
+    if settings.format == "PNG":
+        return [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESS_LEVELS[settings.speed]]
+    if settings.format == "JPEG":
+        return [
+            cv2.IMWRITE_JPEG_QUALITY, settings.quality,
+            cv2.IMWRITE_JPEG_OPTIMIZE, int(settings.speed != "fast"),
+            cv2.IMWRITE_JPEG_PROGRESSIVE, int(settings.speed == "small"),
+        ]
+    if settings.format == "WEBP":
+        # OpenCV switches WebP to lossless for quality > 100
+        return [cv2.IMWRITE_WEBP_QUALITY, 101 if settings.lossless else settings.quality]
+    return []
+
+
+def encode_region(image: "np.ndarray", box: Box, settings: OutputSettings) -> bytes:
+    """Cuts one (x, y, w, h) box out of a decoded image and encodes it."""
+    x, y, w, h = box
+    ok, encoded = cv2.imencode(settings.extension, image[y:y + h, x:x + w], imencode_params(settings))
+    if not ok:
+        raise ValueError("Failed to encode cropped region.")
+    return encoded.tobytes()
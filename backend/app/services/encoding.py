@@ -0,0 +1,142 @@
+# backend/app/services/encoding.py
+"""
+Output encodings for crops.
+
+A request (or the deployment default) picks an output format and a speed
+preset; resolve() turns that into an OutputSettings that knows how to encode
+a Pillow image, which content type and extension to store it under, and the
+variant string that goes into the crop's storage key.
+
+    original       re-encode in the source format (PNG/JPEG/WebP use the presets below)
+    png            lossless, zlib level by speed: fast=1, balanced=6, small=9
+    jpeg           quality 1-95 (default CROP_JPEG_QUALITY); balanced/small add
+                   Huffman optimisation, small also progressive
+    webp           quality 1-100 (default CROP_WEBP_QUALITY); encoder method by
+                   speed: fast=2, balanced=4, small=6
+    webp_lossless  lossless WebP; compression effort by speed
+"""
+import io
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app.config import CROP_JPEG_QUALITY, CROP_OUTPUT_FORMAT, CROP_OUTPUT_SPEED, CROP_WEBP_QUALITY
+from app.utils.startup import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+OUTPUT_FORMATS = ("original", "png", "jpeg", "webp", "webp_lossless")
+SPEEDS = ("fast", "balanced", "small")
+
+PNG_COMPRESS_LEVELS = {"fast": 1, "balanced": 6, "small": 9}
+WEBP_METHODS = {"fast": 2, "balanced": 4, "small": 6}
+# Lossless WebP: (method, effort) - "quality" is the compression effort there
+WEBP_LOSSLESS_EFFORT = {"fast": (1, 25), "balanced": (4, 75), "small": (6, 100)}
+
+_PILLOW_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP", "webp_lossless": "WEBP"}
+# Image.MIME is only filled in as Pillow plugins get loaded
+_CONTENT_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+@dataclass(frozen=True)
+class OutputSettings:
+    format: str              # Pillow format name, e.g. "PNG"
+    speed: str = "balanced"
+    quality: Optional[int] = None
+    lossless: bool = False
+
+    @property
+    def extension(self) -> str:
+        return ".jpg" if self.format in ("JPEG", "MPO") else f".{self.format.lower()}"
+
+    @property
+    def content_type(self) -> str:
+        return _CONTENT_TYPES.get(self.format) or Image.MIME.get(self.format, "application/octet-stream")
+
+    @property
+    def variant(self) -> str:
+        """Everything that changes the encoded bytes; part of the crop storage key."""
+        parts = [self.format, self.speed]
+        if self.quality is not None:
+            parts.append(f"q{self.quality}")
+        if self.lossless:
+            parts.append("lossless")
+        return "|".join(parts)
+
+    def save_options(self) -> Dict[str, Any]:
+        if self.format == "PNG":
+            return {"compress_level": PNG_COMPRESS_LEVELS[self.speed], "optimize": self.speed == "small"}
+        if self.format == "JPEG":
+            return {
+                "quality": self.quality,
+                "optimize": self.speed != "fast",
+                "progressive": self.speed == "small",
+            }
+        if self.format == "WEBP" and self.lossless:
+            method, effort = WEBP_LOSSLESS_EFFORT[self.speed]
+            return {"lossless": True, "method": method, "quality": effort}
+        if self.format == "WEBP":
+            return {"quality": self.quality, "method": WEBP_METHODS[self.speed]}
+        return {}
+
+    def encode(self, image: "Image.Image") -> bytes:
+        buffer = io.BytesIO()
+        _convert_for(image, self.format).save(buffer, format=self.format, **self.save_options())
+        return buffer.getvalue()
+
+
+def _has_alpha(image: "Image.Image") -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def _convert_for(image: "Image.Image", image_format: str) -> "Image.Image":
+    """Converts modes the target format cannot store (JPEG has no alpha, WebP is RGB(A) only)."""
+    if image_format == "JPEG":
+        if image.mode in ("RGB", "L", "CMYK"):
+            return image
+        if _has_alpha(image):
+            # Flatten onto white, which is what a scanned page looks like
+            rgba = image.convert("RGBA")
+            flattened = Image.new("RGB", image.size, "white")
+            flattened.paste(rgba, mask=rgba.getchannel("A"))
+            return flattened
+        return image.convert("L" if image.mode in ("1", "I", "I;16", "F") else "RGB")
+    if image_format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+        return image.convert("RGBA" if _has_alpha(image) else "RGB")
+    return image
+
+
+def resolve(
+    output_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    speed: Optional[str] = None,
+    source_format: Optional[str] = None,
+) -> OutputSettings:
+    """
+    Output settings for a request; unset values fall back to the deployment
+    defaults. Raises ValueError for unknown formats/speeds or a bad quality.
+    """
+    output_format = (output_format or CROP_OUTPUT_FORMAT).lower()
+    speed = (speed or CROP_OUTPUT_SPEED).lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of: {', '.join(OUTPUT_FORMATS)}.")
+    if speed not in SPEEDS:
+        raise ValueError(f"speed must be one of: {', '.join(SPEEDS)}.")
+
+    if output_format == "original":
+        pillow_format = "JPEG" if source_format == "MPO" else (source_format or "PNG")
+    else:
+        pillow_format = _PILLOW_FORMATS[output_format]
+    lossless = output_format == "webp_lossless"
+
+    if pillow_format == "JPEG" and not lossless:
+        quality = CROP_JPEG_QUALITY if quality is None else quality
+        if not 1 <= quality <= 95:
+            raise ValueError("JPEG quality must be between 1 and 95.")
+    elif pillow_format == "WEBP" and not lossless:
+        quality = CROP_WEBP_QUALITY if quality is None else quality
+        if not 1 <= quality <= 100:
+            raise ValueError("WebP quality must be between 1 and 100.")
+    else:
+        # Lossless outputs: quality does not apply
+        quality = None
+    return OutputSettings(format=pillow_format, speed=speed, quality=quality, lossless=lossless)
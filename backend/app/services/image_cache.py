@@ -0,0 +1,122 @@
+# backend/app/services/image_cache.py
+"""
+Decoded source images kept in memory between requests.
+
+A page can be registered once (POST /images/sources) and cropped many times
+by id. Entries are keyed by the content digest of the source bytes, bounded
+by a total pixel-memory budget, evicted least-recently-used first and
+expired by age.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from app.config import IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL_SECONDS
+from app.utils.startup import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+# Bytes per pixel for modes that are not one byte per band
+_MODE_BYTES = {"I": 4, "F": 4, "I;16": 2, "I;16L": 2, "I;16B": 2, "1": 1}
+
+
+def image_nbytes(image: "Image.Image") -> int:
+    """Approximate size of the decoded pixel buffer."""
+    per_pixel = _MODE_BYTES.get(image.mode, len(image.getbands()))
+    return image.width * image.height * per_pixel
+
+
+@dataclass
+class SourceImage:
+    source_id: str  # content digest of the encoded source bytes
+    image: "Image.Image"
+    format: str
+    filename: Optional[str] = None
+    decoded: bool = False
+    # Encoded bytes of a not yet decoded upload, for region decoding (dropped once decoded)
+    data: Optional[bytes] = None
+    created_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def nbytes(self) -> int:
+        return image_nbytes(self.image)
+
+
+class DecodedImageCache:
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, SourceImage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, source_id: str):
+        entry = self._entries.pop(source_id)
+        self.current_bytes -= entry.nbytes
+
+    def get(self, source_id: str) -> Optional[SourceImage]:
+        with self._lock:
+            entry = self._entries.get(source_id)
+            if entry is not None and time.monotonic() - entry.created_at > self.ttl_seconds:
+                self._drop(source_id)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(source_id)
+            self.hits += 1
+            return entry
+
+    def peek(self, source_id: str) -> Optional[SourceImage]:
+        """Returns an entry without counting a lookup or refreshing its recency."""
+        with self._lock:
+            return self._entries.get(source_id)
+
+    def put(self, entry: SourceImage) -> bool:
+        """Stores a decoded image; returns False when it alone exceeds the budget."""
+        size = entry.nbytes
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if entry.source_id in self._entries:
+                self._drop(entry.source_id)
+            self._entries[entry.source_id] = entry
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+        return True
+
+    def remove(self, source_id: str) -> bool:
+        with self._lock:
+            if source_id not in self._entries:
+                return False
+            self._drop(source_id)
+            return True
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Process-wide cache shared by the image endpoints
+cache = DecodedImageCache(IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL_SECONDS)
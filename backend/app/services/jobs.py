@@ -0,0 +1,241 @@
+# backend/app/services/jobs.py
+"""
+Background jobs for heavy image work.
+
+Submitting a job returns its id immediately; a fixed number of worker tasks
+take jobs off a bounded queue and run them, publishing progress events that
+clients can poll (GET /images/jobs/{id}) or follow as Server-Sent Events.
+
+Job state goes through the JobStore interface. InMemoryJobStore keeps it in
+this process; a Redis-backed store (hashes for jobs, streams for events)
+can implement the same methods to share jobs between workers.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import JOB_MAX_WORKERS, JOB_QUEUE_SIZE, JOB_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("completed", "failed")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobStore(ABC):
+    """Persistence for job records and their ordered event log."""
+
+    @abstractmethod
+    async def create(self, job: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def update(self, job_id: str, **fields: Any): ...
+
+    @abstractmethod
+    async def add_event(self, job_id: str, event: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def events_since(self, job_id: str, index: int) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def wait_for_event(self, job_id: str, index: int, timeout: float) -> bool:
+        """Waits until the job has more than `index` events; False on timeout."""
+
+    @abstractmethod
+    async def purge_expired(self) -> int: ...
+
+
+class InMemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    async def create(self, job):
+        self._jobs[job["id"]] = job
+        self._events[job["id"]] = []
+        self._changed[job["id"]] = asyncio.Event()
+
+    async def get(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is not None and job.get("expires_at") and job["expires_at"] < time.time():
+            self._remove(job_id)
+            return None
+        return dict(job) if job is not None else None
+
+    async def update(self, job_id, **fields):
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    async def add_event(self, job_id, event):
+        if job_id not in self._events:
+            return
+        self._events[job_id].append(event)
+        # Wake every waiter, then arm a fresh event for the next change
+        self._changed[job_id].set()
+        self._changed[job_id] = asyncio.Event()
+
+    async def events_since(self, job_id, index):
+        return self._events.get(job_id, [])[index:]
+
+    async def wait_for_event(self, job_id, index, timeout):
+        if len(self._events.get(job_id, [])) > index:
+            return True
+        changed = self._changed.get(job_id)
+        if changed is None:
+            return False
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items() if job.get("expires_at") and job["expires_at"] < now]
+        for job_id in expired:
+            self._remove(job_id)
+        return len(expired)
+
+    def _remove(self, job_id):
+        self._jobs.pop(job_id, None)
+        self._events.pop(job_id, None)
+        self._changed.pop(job_id, None)
+
+
+class JobContext:
+    """Handed to a running job to report progress. report() is safe to call from any thread."""
+
+    def __init__(self, manager: "JobManager", job_id: str, loop: asyncio.AbstractEventLoop):
+        self._manager = manager
+        self._loop = loop
+        self._pending: List[Any] = []
+        self._lock = threading.Lock()
+        self.job_id = job_id
+
+    def report(self, stage: str, done: int, total: int, item: Optional[Dict[str, Any]] = None):
+        event = {"type": "progress", "stage": stage, "done": done, "total": total}
+        if item is not None:
+            event["item"] = item
+
+        async def publish():
+            await self._manager.store.update(self.job_id, progress={"stage": stage, "done": done, "total": total})
+            await self._manager.store.add_event(self.job_id, event)
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            with self._lock:
+                self._pending.append(self._loop.create_task(publish()))
+        else:
+            with self._lock:
+                self._pending.append(asyncio.run_coroutine_threadsafe(publish(), self._loop))
+
+    async def flush(self):
+        """Waits until every reported event has been published."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        await asyncio.gather(
+            *(asyncio.wrap_future(p) if isinstance(p, concurrent.futures.Future) else p for p in pending),
+            return_exceptions=True,
+        )
+
+
+JobRunner = Callable[[JobContext], Awaitable[Dict[str, Any]]]
+
+
+class JobManager:
+    def __init__(self, store: JobStore, workers: int, queue_size: int, ttl_seconds: float):
+        self.store = store
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl_seconds = ttl_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _ensure_workers(self):
+        # Started lazily so the queue and tasks belong to the serving event loop
+        loop = asyncio.get_running_loop()
+        if self._queue is not None and self._tasks and self._tasks[0].get_loop() is loop:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        # Fresh context: workers outlive the request that starts them and must not
+        # keep its context variables (e.g. its Server-Timing stage list)
+        self._tasks = [
+            loop.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)
+        ]
+
+    async def submit(self, kind: str, runner: JobRunner, total: int = 0) -> Dict[str, Any]:
+        """Queues a job and returns its record; raises JobQueueFull when saturated."""
+        self._ensure_workers()
+        await self.store.purge_expired()
+        if self._queue.full():
+            raise JobQueueFull()
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "expires_at": None,
+            "progress": {"stage": "queued", "done": 0, "total": total},
+            "result": None,
+            "error": None,
+        }
+        await self.store.create(job)
+        self._queue.put_nowait((job["id"], runner))
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id, runner = await self._queue.get()
+            try:
+                await self._run(job_id, runner)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, runner: JobRunner):
+        await self.store.update(job_id, status="running", started_at=time.time())
+        await self.store.add_event(job_id, {"type": "status", "status": "running"})
+        context = JobContext(self, job_id, asyncio.get_running_loop())
+        try:
+            result = await runner(context)
+            status, fields, event = "completed", {"result": result}, {"type": "completed", "result": result}
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e)
+            logger.error(f"Job {job_id} failed: {error}")
+            status, fields, event = "failed", {"error": error}, {"type": "failed", "error": error}
+        # Progress reported from worker threads must land before the final event
+        await context.flush()
+        finished = time.time()
+        await self.store.update(
+            job_id, status=status, finished_at=finished, expires_at=finished + self.ttl_seconds, **fields
+        )
+        await self.store.add_event(job_id, event)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+# Process-wide manager used by the image router
+manager = JobManager(InMemoryJobStore(), JOB_MAX_WORKERS, JOB_QUEUE_SIZE, JOB_TTL_SECONDS)
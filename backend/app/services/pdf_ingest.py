@@ -0,0 +1,184 @@
+# backend/app/services/pdf_ingest.py
+"""
+PDF question-paper ingestion.
+
+The uploaded PDF is spooled to a temporary file and its pages are rasterized
+in parallel on a process pool (PDFium is not thread-safe, and rasterizing is
+CPU bound). Each worker opens the file itself, so only the path and page
+number cross the process boundary, and only the encoded page comes back.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import UploadFile
+
+from app.config import PDF_MAX_WORKERS
+from app.utils.startup import lazy_import
+
+pdfium = lazy_import("pypdfium2")
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Pages rendered at once by render_pages(): two per worker
+RENDER_WINDOW = 2 * PDF_MAX_WORKERS
+
+# Memory per rendered pixel: PDFium's BGRA bitmap plus its RGB PIL copy
+RENDER_BYTES_PER_PIXEL = 7
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Returns the rasterizing pool, creating it on first use."""
+    global _process_pool
+    if _process_pool is None:
+        # spawn: forking a process that already runs event-loop and pool threads is unsafe
+        _process_pool = ProcessPoolExecutor(
+            max_workers=PDF_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def discard_process_pool(pool: ProcessPoolExecutor):
+    """
+    Drops a broken pool (a worker died, e.g. OOM-killed on a huge page) so the
+    next get_process_pool() starts a new one.
+    """
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def spool_to_disk(file: UploadFile) -> str:
+    """Copies an upload to a temporary file chunk by chunk and returns its path."""
+    handle, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(handle, "wb") as spooled:
+            while chunk := await file.read(SPOOL_CHUNK_SIZE):
+                spooled.write(chunk)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+
+def is_pdf(path: str) -> bool:
+    with open(path, "rb") as spooled:
+        return spooled.read(5) == b"%PDF-"
+
+
+def count_pages(path: str) -> int:
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def render_estimate(path: str, dpi: int) -> int:
+    """Bytes needed to rasterize the document's largest page at `dpi`."""
+    pdf = pdfium.PdfDocument(path)
+    try:
+        sizes = [pdf.get_page_size(index) for index in range(len(pdf))]
+    finally:
+        pdf.close()
+    largest = max((width * height for width, height in sizes), default=0)
+    return int(largest * (dpi / 72) ** 2 * RENDER_BYTES_PER_PIXEL)
+
+
+def render_page(path: str, page_index: int, dpi: int, detect: bool, detect_options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rasterizes one page to PNG (runs in a worker process). When `detect` is set,
+    auto-crop detection runs on the rendered pixels and the boxes are returned
+    as left/top/right/bottom in reading order, ready to be sent to /images/multicrop.
+    """
+    pdf = pdfium.PdfDocument(path)
+    try:
+        page = pdf[page_index]
+        image = page.render(scale=dpi / 72).to_pil()
+        page.close()
+    finally:
+        pdf.close()
+
+    boxes = []
+    if detect:
+        # Imported here so workers that only rasterize never load OpenCV
+        from app.services import detection
+        regions = detection.detect_regions(detection.from_pil(image), **detect_options)
+        regions = detection.arrange_boxes(regions, image.width, image.height)
+        boxes = [{"left": x, "top": y, "right": x + w, "bottom": y + h} for x, y, w, h in regions]
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return {
+        "page": page_index + 1,
+        "width": image.width,
+        "height": image.height,
+        "data": buffer.getvalue(),
+        "boxes": boxes,
+    }
+
+
+async def render_pages(
+    path: str, page_indexes: List[int], dpi: int, detect: bool, detect_options: Dict[str, Any]
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yields rendered pages as they finish (not in page order). At most two pages
+    per worker are in flight, so finished pages do not pile up in memory while
+    the caller is still uploading earlier ones.
+
+    A page that fails yields {"page", "error"} instead. If a worker dies, the
+    pool is discarded (the next document gets a new one) and every page not
+    rendered yet is reported as failed.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    queued = iter(page_indexes)
+    pending = set()
+    pages = {}
+    broken: Optional[BrokenProcessPool] = None
+
+    def pool_broke(error: BrokenProcessPool):
+        nonlocal broken
+        if broken is None:
+            broken = error
+            discard_process_pool(pool)
+
+    try:
+        while True:
+            for page_index in queued:
+                if broken is None:
+                    try:
+                        future = loop.run_in_executor(pool, render_page, path, page_index, dpi, detect, detect_options)
+                    except BrokenProcessPool as e:
+                        pool_broke(e)
+                if broken is not None:
+                    yield {"page": page_index + 1, "error": f"Rendering worker failed: {broken}"}
+                    continue
+                pages[future] = page_index + 1
+                pending.add(future)
+                if len(pending) >= RENDER_WINDOW:
+                    break
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                page_number = pages.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    pool_broke(e)
+                    result = {"page": page_number, "error": f"Rendering worker failed: {e}"}
+                except Exception as e:
+                    result = {"page": page_number, "error": str(e)}
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,85 @@
+# backend/app/services/question_images.py
+"""
+Records resized derivatives of question and option crops on the question
+documents, next to `question_image` / `option_images`:
+
+    question_image_derivatives: [{"url": <full size>, "256": <url>, "768": <url>}, ...]
+    option_image_derivatives:   {"<option index>": [{"url": ..., "256": ...}, ...]}
+
+Entries are in crop order, so they line up with the comma-separated
+`question_image` URLs the editor stores. Previews pick the smallest width
+that covers the rendered size and fall back to "url".
+"""
+import logging
+from typing import Any, Dict, List
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+from app.database import get_collection
+from app.services import questions_cache
+
+logger = logging.getLogger(__name__)
+
+QUESTIONS_COLLECTION = "questions"
+
+
+def validate_targets(parsed_crops: List[Dict[str, Any]]):
+    """Raises ValueError when a crop names a question id that is not an ObjectId."""
+    for crop in parsed_crops:
+        target = crop.get("target")
+        if target is None:
+            continue
+        try:
+            ObjectId(target["question_id"])
+        except (InvalidId, TypeError):
+            raise ValueError(f"Invalid question_id for crop {crop['index']}.")
+
+
+def derivative_updates(parsed_crops: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Builds {question_id: $set fields} from the crops that name a question and were stored."""
+    question_images: Dict[str, List[Dict[str, str]]] = {}
+    option_images: Dict[str, Dict[int, List[Dict[str, str]]]] = {}
+    for crop, result in zip(parsed_crops, results):
+        target = crop.get("target")
+        if target is None or not result["uploaded"]:
+            continue
+        entry = {"url": result["url"], **result["derivatives"]}
+        if target["type"] == "question":
+            question_images.setdefault(target["question_id"], []).append(entry)
+        else:
+            options = option_images.setdefault(target["question_id"], {})
+            options.setdefault(target["option_index"], []).append(entry)
+
+    updates: Dict[str, Dict[str, Any]] = {}
+    for question_id, entries in question_images.items():
+        updates.setdefault(question_id, {})["question_image_derivatives"] = entries
+    for question_id, options in option_images.items():
+        for option_index, entries in options.items():
+            updates.setdefault(question_id, {})[f"option_image_derivatives.{option_index}"] = entries
+    return updates
+
+
+async def record_derivatives(parsed_crops: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> int:
+    """
+    Writes the derivative URLs onto the question documents in one unordered
+    bulk write and drops the cached /questions responses containing them.
+    Returns the number of questions matched; failures are logged, since the
+    crops themselves are already stored.
+    """
+    updates = derivative_updates(parsed_crops, results)
+    if not updates:
+        return 0
+    try:
+        result = await get_collection(QUESTIONS_COLLECTION).bulk_write(
+            [UpdateOne({"_id": ObjectId(question_id)}, {"$set": fields}) for question_id, fields in updates.items()],
+            ordered=False,
+        )
+    except Exception as e:
+        logger.error(f"Failed to record image derivatives: {str(e)}")
+        return 0
+    finally:
+        # Also after a failed bulk write: some of the updates may have been applied
+        questions_cache.cache.invalidate(ids=list(updates))
+    return result.matched_count
@@ -0,0 +1,90 @@
+# backend/app/services/question_summary.py
+"""
+Per-file status summary of the questions collection, computed by MongoDB.
+
+One aggregation groups the questions by (file_name, section_name, subject)
+and counts, per group:
+
+    questions               all questions
+    with_question_image     question_image set (non-empty)
+    question_image_enabled  isQuestionImage true
+    with_option_images      at least one non-empty entry in option_images
+    option_image_enabled    isOptionImage true
+    answered                answer set (non-empty)
+
+plus the complements (without_question_image, unanswered). Only these
+counts leave the database, never the documents. The leading $match and
+$sort follow the file_name_section_subject index (see ensure_indexes), so
+a single-file summary reads just that file's index range.
+"""
+from typing import Any, Dict, List, Optional
+
+GROUP_KEYS = ("file_name", "section_name", "subject")
+COUNT_FIELDS = (
+    "questions", "with_question_image", "without_question_image", "question_image_enabled",
+    "with_option_images", "option_image_enabled", "answered", "unanswered",
+)
+
+
+def _is_set(field: str) -> Dict[str, Any]:
+    """Expression: the field is present, not null and not an empty string."""
+    return {"$ne": [{"$ifNull": [f"${field}", ""]}, ""]}
+
+
+def _count_if(condition: Dict[str, Any]) -> Dict[str, Any]:
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+
+def summary_pipeline(file_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    has_option_images = {"$gt": [
+        {"$size": {"$filter": {
+            "input": {"$ifNull": ["$option_images", []]},
+            "cond": {"$ne": [{"$ifNull": ["$$this", ""]}, ""]},
+        }}},
+        0,
+    ]}
+    return [
+        {"$match": {"file_name": file_name} if file_name else {}},
+        {"$sort": {key: 1 for key in GROUP_KEYS}},
+        {"$group": {
+            "_id": {key: f"${key}" for key in GROUP_KEYS},
+            "questions": {"$sum": 1},
+            "with_question_image": _count_if(_is_set("question_image")),
+            "question_image_enabled": _count_if({"$eq": ["$isQuestionImage", True]}),
+            "with_option_images": _count_if(has_option_images),
+            "option_image_enabled": _count_if({"$eq": ["$isOptionImage", True]}),
+            "answered": _count_if(_is_set("answer")),
+        }},
+        {"$sort": {f"_id.{key}": 1 for key in GROUP_KEYS}},
+    ]
+
+
+def _counts(row: Dict[str, Any]) -> Dict[str, int]:
+    counts = {field: row.get(field, 0) for field in COUNT_FIELDS}
+    counts["without_question_image"] = counts["questions"] - counts["with_question_image"]
+    counts["unanswered"] = counts["questions"] - counts["answered"]
+    return counts
+
+
+def _add(total: Dict[str, int], counts: Dict[str, int]):
+    for field in COUNT_FIELDS:
+        total[field] = total.get(field, 0) + counts[field]
+
+
+def shape_summary(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Turns the aggregation rows into {"totals", "files": [{file_name, counts...,
+    "groups": [{section_name, subject, counts...}]}]}, files in name order.
+    """
+    totals: Dict[str, int] = {field: 0 for field in COUNT_FIELDS}
+    files: Dict[Any, Dict[str, Any]] = {}
+    for row in rows:
+        key = row["_id"]
+        counts = _counts(row)
+        entry = files.setdefault(key.get("file_name"), {
+            "file_name": key.get("file_name"), **{field: 0 for field in COUNT_FIELDS}, "groups": [],
+        })
+        entry["groups"].append({"section_name": key.get("section_name"), "subject": key.get("subject"), **counts})
+        _add(entry, counts)
+        _add(totals, counts)
+    return {"totals": totals, "files": list(files.values())}
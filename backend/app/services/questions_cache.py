@@ -0,0 +1,130 @@
+# backend/app/services/questions_cache.py
+"""
+In-process cache of serialized GET /questions responses.
+
+Entries are keyed by (file_name, fields) and hold the JSON body, the _ids of
+the questions in it and a version ETag. Writes invalidate precisely: a new
+question drops the entries for its file_name (and the unfiltered listing),
+an update drops every entry that contains the question plus, when the update
+moves it to another file_name, the entries of that file_name.
+
+ETags carry a per-process token, so a tag issued by another instance or
+before a restart never matches. Entries also expire after a TTL, which
+bounds staleness when several instances share one database.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from app.config import QUESTIONS_CACHE_MAX_BYTES, QUESTIONS_CACHE_TTL_SECONDS
+
+# (file_name or None for the unfiltered listing, fields projection or None)
+CacheKey = Tuple[Optional[str], Optional[str]]
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    ids: FrozenSet[str]
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class QuestionsResponseCache:
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex[:8]
+        self._version = 0
+        # Bumped by every invalidation; a response built across one is not stored
+        self.generation = 0
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key: CacheKey):
+        entry = self._entries.pop(key)
+        self.current_bytes -= len(entry.body)
+
+    def get(self, key: CacheKey) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created_at > self.ttl_seconds:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def put(self, key: CacheKey, body: bytes, ids: Iterable[str], generation: int) -> str:
+        """
+        Stores a freshly built body and returns its ETag. Nothing is stored when
+        the body is over budget or a write invalidated the cache since
+        `generation` was read, but the ETag is still unique to this body.
+        """
+        with self._lock:
+            self._version += 1
+            etag = f'"{self._token}-{self._version}"'
+            if len(body) > self.max_bytes or generation != self.generation:
+                return etag
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = CachedResponse(body=body, etag=etag, ids=frozenset(ids))
+            self.current_bytes += len(body)
+            while self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            return etag
+
+    def invalidate(self, file_names: Iterable[Optional[str]] = (), ids: Iterable[str] = ()):
+        """Drops the entries of `file_names` and every entry containing one of `ids`; the unfiltered listing always goes."""
+        file_names = set(file_names)
+        ids = {str(question_id) for question_id in ids}
+        with self._lock:
+            self.generation += 1
+            for key in list(self._entries):
+                file_name, _ = key
+                if file_name is None or file_name in file_names or not ids.isdisjoint(self._entries[key].ids):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Process-wide cache shared by the question routes
+cache = QuestionsResponseCache(QUESTIONS_CACHE_MAX_BYTES, QUESTIONS_CACHE_TTL_SECONDS)
@@ -0,0 +1,195 @@
+# backend/app/services/storage_index.py
+"""
+Content-addressed storage for uploads and crops.
+
+Storage keys are derived from a hash of the source bytes plus whatever else
+determines the output (crop box, output format), so identical requests map to
+the same object. An index of stored keys lives in MongoDB, fronted by a small
+in-process LRU, and anything already stored is returned without being encoded
+or uploaded again.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pymongo.errors import BulkWriteError
+
+from app.config import STORAGE_INDEX_CACHE_SIZE
+from app.database import get_collection
+from app.utils import metrics
+from app.utils.supabase_client import upload_files_batch
+
+logger = logging.getLogger(__name__)
+
+INDEX_COLLECTION = "stored_objects"
+
+# key -> public URL of objects known to be stored, most recently used last
+_known: "OrderedDict[str, str]" = OrderedDict()
+_known_lock = threading.Lock()
+
+
+def content_digest(data: bytes) -> str:
+    """SHA-256 of the source bytes, hex encoded."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file on disk, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_key(source_digest: str, extension: str) -> str:
+    """Storage key of an uploaded source image."""
+    return f"uploads/{source_digest}{extension}"
+
+
+def page_key(document_digest: str, page_number: int, dpi: int, extension: str) -> str:
+    """Storage key of a rasterized PDF page."""
+    return f"pages/{document_digest}/{page_number}-{dpi}dpi{extension}"
+
+
+def crop_key(source_digest: str, box: Sequence[int], variant: str, extension: str) -> str:
+    """
+    Storage key of a crop. `variant` must capture every output setting
+    (format, quality, ...) so different encodings never share a key.
+    """
+    spec = f"{source_digest}|{','.join(str(int(v)) for v in box)}|{variant}"
+    return f"crops/{hashlib.sha256(spec.encode()).hexdigest()}{extension}"
+
+
+def derivative_key(key: str, width: int) -> str:
+    """Key of a resized derivative of a stored image: "crops/<hash>.webp" -> "crops/<hash>_w256.webp"."""
+    root, dot, extension = key.rpartition(".")
+    return f"{root}_w{width}.{extension}" if dot else f"{key}_w{width}"
+
+
+def _remember(key: str, url: str):
+    with _known_lock:
+        _known[key] = url
+        _known.move_to_end(key)
+        while len(_known) > STORAGE_INDEX_CACHE_SIZE:
+            _known.popitem(last=False)
+
+
+async def lookup(keys: Sequence[str]) -> Dict[str, str]:
+    """Returns {key: url} for the keys that are already stored."""
+    found: Dict[str, str] = {}
+    missing: List[str] = []
+    with _known_lock:
+        for key in dict.fromkeys(keys):
+            if key in _known:
+                _known.move_to_end(key)
+                found[key] = _known[key]
+            else:
+                missing.append(key)
+
+    if missing:
+        try:
+            async for entry in get_collection(INDEX_COLLECTION).find({"_id": {"$in": missing}}, {"url": 1}):
+                found[entry["_id"]] = entry["url"]
+                _remember(entry["_id"], entry["url"])
+        except Exception as e:
+            # The index is only an optimisation; without it everything is treated as new
+            logger.warning(f"Storage index lookup failed: {str(e)}")
+    return found
+
+
+async def record(entries: Dict[str, Tuple[str, int]]):
+    """Adds {key: (url, size)} to the index."""
+    if not entries:
+        return
+    for key, (url, _) in entries.items():
+        _remember(key, url)
+    now = datetime.now(timezone.utc)
+    documents = [
+        {"_id": key, "url": url, "size": size, "created_at": now}
+        for key, (url, size) in entries.items()
+    ]
+    try:
+        await get_collection(INDEX_COLLECTION).insert_many(documents, ordered=False)
+    except BulkWriteError:
+        # Another request stored the same content first; the entry is already there
+        pass
+    except Exception as e:
+        logger.warning(f"Storage index update failed: {str(e)}")
+
+
+async def store_objects(
+    keys: Sequence[str],
+    encode_missing: Callable[[List[str]], Awaitable[List[bytes]]],
+    content_type: str,
+    report: Optional[Callable[[str, int, int, Dict], None]] = None,
+) -> List[Dict]:
+    """
+    Makes sure every key is stored and returns one upload result per key, in order.
+
+    Only keys missing from the index are passed to `encode_missing`, which must
+    return their encoded bytes in the same order; those are uploaded in one
+    batch. Results have the shape of upload_files_batch results plus
+    "deduplicated" (True when nothing had to be encoded or uploaded).
+
+    `report(stage, done, total, item)` is called once per distinct key as soon
+    as it is known to be stored (possibly from an upload thread).
+    """
+    with metrics.stage("index_lookup"):
+        existing = await lookup(keys)
+    unique_keys = list(dict.fromkeys(keys))
+    to_store = [key for key in unique_keys if key not in existing]
+
+    reported = 0
+    reported_lock = threading.Lock()
+
+    def stored(result: Dict):
+        nonlocal reported
+        if report is None:
+            return
+        with reported_lock:
+            reported += 1
+            done = reported
+        report("store", done, len(unique_keys), {
+            "key": result["destination_path"], "url": result["url"], "success": result["success"],
+            "deduplicated": result["deduplicated"], "error": result["error"],
+        })
+
+    for key in unique_keys:
+        if key in existing:
+            stored({"destination_path": key, "url": existing[key], "success": True, "error": None, "deduplicated": True})
+
+    uploaded: Dict[str, Dict] = {}
+    if to_store:
+        encoded = await encode_missing(to_store)
+        with metrics.stage("upload"):
+            uploads = await run_in_threadpool(
+                upload_files_batch,
+                [
+                    {"destination_path": key, "data": data, "content_type": content_type}
+                    for key, data in zip(to_store, encoded)
+                ],
+                upsert=True,
+                on_result=lambda result: stored({**result, "deduplicated": False}),
+            )
+        sizes = {key: len(data) for key, data in zip(to_store, encoded)}
+        uploaded = {upload["destination_path"]: upload for upload in uploads}
+        with metrics.stage("index_record"):
+            await record({
+                key: (upload["url"], sizes[key]) for key, upload in uploaded.items() if upload["success"]
+            })
+
+    results = []
+    for key in keys:
+        if key in existing:
+            results.append({
+                "destination_path": key, "url": existing[key], "success": True, "error": None,
+                "deduplicated": True,
+            })
+        else:
+            results.append({**uploaded[key], "deduplicated": False})
+    return results
@@ -0,0 +1,86 @@
+# backend/app/utils/ingest.py
+"""
+Zero-copy access to uploaded request bodies.
+
+Starlette already spools multipart uploads above 1 MiB to a temporary file.
+read_upload() memory-maps that file instead of reading it into a bytes
+object, so a large scan is held once, in the page cache, rather than once
+per copy on the heap. Small uploads are simply read.
+
+Anything that needs a file object gets a BufferReader over the buffer: it
+has its own position and copies only the chunks actually read, unlike
+io.BytesIO(buffer), which copies the whole buffer up front. The same reader
+lets storage uploads stream an mmap straight from the page cache.
+"""
+import io
+import mmap
+import os
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    # Not imported at runtime: PDF worker processes use BufferReader too
+    from fastapi import UploadFile
+
+# Uploads at least this large are memory-mapped (Starlette's spool threshold)
+MMAP_MIN_BYTES = 1024 * 1024
+
+# What read_upload() returns: bytes for small uploads, an mmap for large ones
+Buffer = Union[bytes, mmap.mmap]
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable, read-only file object over a bytes-like buffer."""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        count = max(0, min(len(target), len(self._view) - self._position))
+        target[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        # Drop the export so the underlying mmap can be closed
+        self._view.release()
+        super().close()
+
+
+async def read_upload(file: "UploadFile") -> Buffer:
+    """
+    The upload's bytes: an mmap of its spool file when it is large, else the
+    bytes read. The mapping stays valid after the upload is closed.
+    """
+    if (file.size or 0) < MMAP_MIN_BYTES:
+        await file.seek(0)
+        return await file.read()
+    try:
+        file.file.flush()
+        descriptor = file.file.fileno()
+        if os.fstat(descriptor).st_size == 0:
+            return b""
+        return mmap.mmap(descriptor, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        await file.seek(0)
+        return await file.read()
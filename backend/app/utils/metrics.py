@@ -0,0 +1,188 @@
+# backend/app/utils/metrics.py
+"""
+Request stage timing and Prometheus-format metrics.
+
+`stage("decode")` times a block of work: the duration goes into the
+stage_duration_seconds histogram and into the current request's
+Server-Timing header (see ServerTimingMiddleware in app.main). Counters and
+histograms are rendered in the Prometheus text format by GET /metrics.
+Kept dependency-free on purpose; the output is compatible with any
+Prometheus scraper.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _format_labels(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+_registry: List = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+REQUEST_DURATION = _register(Histogram(
+    "multicrop_request_duration_seconds", "HTTP request duration.", ("method", "route", "status")
+))
+STAGE_DURATION = _register(Histogram(
+    "multicrop_stage_duration_seconds", "Duration of one processing stage within a request.", ("stage",)
+))
+BYTES_DECODED = _register(Counter(
+    "multicrop_bytes_decoded_total", "Pixel bytes produced by decoding source images."
+))
+BYTES_ENCODED = _register(Counter(
+    "multicrop_bytes_encoded_total", "Bytes produced by encoding crops and pages.", ("format",)
+))
+UPLOADS = _register(Counter(
+    "multicrop_uploads_total", "Storage uploads by outcome.", ("outcome",)
+))
+UPLOAD_BYTES = _register(Counter(
+    "multicrop_upload_bytes_total", "Bytes sent to storage."
+))
+DB_OPERATIONS = _register(Counter(
+    "multicrop_db_operations_total", "MongoDB operations by collection and operation.", ("collection", "operation")
+))
+QUESTIONS_CACHE_REQUESTS = _register(Counter(
+    "multicrop_questions_cache_requests_total", "Cacheable /questions requests by result (hit, miss, not_modified).", ("result",)
+))
+ADMISSION_IN_FLIGHT = _register(Gauge(
+    "multicrop_admission_in_flight", "Image requests currently admitted."
+))
+ADMISSION_QUEUE_DEPTH = _register(Gauge(
+    "multicrop_admission_queue_depth", "Image requests waiting for admission."
+))
+ADMISSION_RESERVED_BYTES = _register(Gauge(
+    "multicrop_admission_reserved_bytes", "Estimated pixel memory reserved by admitted image requests."
+))
+ADMISSION_REJECTIONS = _register(Counter(
+    "multicrop_admission_rejections_total", "Image requests answered 503 by reason (queue_full, timeout).", ("reason",)
+))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Stage timings of the current request: list of (stage, seconds), or None outside a request
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timing() -> List[Tuple[str, float]]:
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_DURATION.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times the enclosed block as one stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Server-Timing value with repeated stages summed, in first-seen order."""
+    totals: Dict[str, float] = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name.replace('.', '-')};dur={1000 * seconds:.1f}" for name, seconds in totals.items())
@@ -0,0 +1,84 @@
+# backend/app/utils/startup.py
+"""
+Cold-start accounting and deferred imports.
+
+Heavy libraries (OpenCV, NumPy, Pillow, pypdfium2, the Supabase SDK) are
+bound with lazy_import() so they load on first attribute access instead of
+when app.main is imported; routes that never touch images never pay for
+them. Every deferred import and every init step wrapped in timed() is
+recorded, and report() (served at GET /startup) lists them with their cost.
+"""
+import importlib
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# Set when the first app module imports this one, i.e. at the start of `import app.main`
+IMPORT_STARTED = time.perf_counter()
+
+# Libraries whose presence in sys.modules the report shows
+WATCHED_MODULES = ("cv2", "numpy", "PIL", "pypdfium2", "supabase", "httpx", "pymongo")
+
+_entries: List[Dict] = []
+_lock = threading.Lock()
+
+
+def record(kind: str, name: str, seconds: float):
+    with _lock:
+        _entries.append({
+            "kind": kind,
+            "name": name,
+            "seconds": round(seconds, 4),
+            "at": round(time.perf_counter() - IMPORT_STARTED, 4),
+        })
+
+
+@contextmanager
+def timed(kind: str, name: str) -> Iterator[None]:
+    """Records how long the enclosed block (an import or an init step) took."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, name, time.perf_counter() - started)
+
+
+class LazyModule(types.ModuleType):
+    """Module placeholder that imports the real module on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    with timed("import", self.__name__):
+                        module = importlib.import_module(self.__name__)
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """`cv2 = lazy_import("cv2")` binds a module that is only imported when used."""
+    return LazyModule(name)
+
+
+def report() -> Dict:
+    with _lock:
+        entries = list(_entries)
+    return {
+        "uptime_seconds": round(time.perf_counter() - IMPORT_STARTED, 3),
+        "entries": entries,
+        "loaded_modules": [name for name in WATCHED_MODULES if name in sys.modules],
+    }
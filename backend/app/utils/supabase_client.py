@@ -1,46 +1,183 @@
 # backend/app/utils/supabase_client.py
-from supabase import create_client, Client
-from app.config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET
+import logging
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import quote
 
-# Use the config values instead of hardcoding
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+from app.config import (
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    SUPABASE_BUCKET,
+    SUPABASE_UPLOAD_CONCURRENCY,
+    SUPABASE_UPLOAD_TIMEOUT,
+)
+from app.utils import metrics
+from app.utils.ingest import Buffer, BufferReader
+from app.utils.startup import lazy_import, timed
 
-def upload_file_supabase(file_obj, destination_path: str) -> str:
+# httpx and the Supabase SDK load on the first upload, not at startup
+httpx = lazy_import("httpx")
+
+logger = logging.getLogger(__name__)
+
+# Supabase SDK client, pooled HTTP client and worker threads used for batch uploads; created on first use
+_supabase = None
+_http_client: Optional["httpx.Client"] = None
+_upload_executor: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def build_public_url(destination_path: str) -> str:
+    """
+    Builds the public URL of an object in the bucket without a round trip to Supabase.
+    The path is quoted exactly as upload_bytes() quotes it when storing the object.
+    """
+    return f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{quote(destination_path)}"
+
+
+def get_supabase():
+    """Returns the Supabase SDK client, creating it on first use."""
+    global _supabase
+    with _pool_lock:
+        if _supabase is None:
+            with timed("init", "supabase.create_client"):
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return _supabase
+
+
+def get_http_client() -> "httpx.Client":
+    """
+    Returns the shared storage HTTP client. Connections are kept alive and reused
+    across uploads, with one connection per allowed concurrent upload.
+    """
+    global _http_client
+    with _pool_lock:
+        if _http_client is None:
+            with timed("init", "storage.http_client"):
+                _http_client = httpx.Client(
+                    base_url=f"{SUPABASE_URL}/storage/v1",
+                    headers={"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY},
+                    limits=httpx.Limits(
+                        max_connections=SUPABASE_UPLOAD_CONCURRENCY,
+                        max_keepalive_connections=SUPABASE_UPLOAD_CONCURRENCY,
+                    ),
+                    timeout=SUPABASE_UPLOAD_TIMEOUT,
+                )
+        return _http_client
+
+
+def _get_upload_executor() -> ThreadPoolExecutor:
+    global _upload_executor
+    with _pool_lock:
+        if _upload_executor is None:
+            _upload_executor = ThreadPoolExecutor(
+                max_workers=SUPABASE_UPLOAD_CONCURRENCY, thread_name_prefix="upload"
+            )
+        return _upload_executor
+
+
+def upload_bytes(destination_path: str, data: Buffer, content_type: str = "image/png", upsert: bool = False) -> str:
+    """
+    Uploads raw bytes through the pooled client and returns the public URL.
+    """
+    # Bytes-like buffers other than bytes (e.g. an mmap'd upload) stream from memory without a copy
+    content = data if isinstance(data, bytes) else BufferReader(data)
+    try:
+        response = get_http_client().post(
+            f"/object/{SUPABASE_BUCKET}/{quote(destination_path)}",
+            content=content,
+            # Explicit, so a streamed body is never sent with chunked transfer encoding
+            headers={
+                "content-type": content_type,
+                "content-length": str(len(data)),
+                "x-upsert": "true" if upsert else "false",
+            },
+        )
+        if response.status_code >= 400:
+            raise Exception(f"Failed to upload file: {response.status_code} {response.text}")
+    except Exception:
+        metrics.UPLOADS.inc(outcome="failure")
+        raise
+    finally:
+        # Releases the reader's view of the buffer so the caller can close its mmap
+        if content is not data:
+            content.close()
+    metrics.UPLOADS.inc(outcome="success")
+    metrics.UPLOAD_BYTES.inc(len(data))
+    return build_public_url(destination_path)
+
+
+def upload_files_batch(
+    files: List[Dict[str, Any]],
+    max_concurrency: Optional[int] = None,
+    upsert: bool = False,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Uploads many files concurrently over the pooled connection.
+
+    Each item is a dict with "destination_path", "data" (bytes or an mmap) and optionally
+    "content_type". Returns one result per item, in the same order:
+    {"destination_path", "url", "success", "error"}. A failed upload does not
+    stop the others. `on_result` is called (from the upload threads) with each
+    result as soon as that upload finishes.
+    """
+    limit = max(1, min(max_concurrency or SUPABASE_UPLOAD_CONCURRENCY, SUPABASE_UPLOAD_CONCURRENCY))
+    slots = threading.Semaphore(limit)
+
+    def upload_one(item: Dict[str, Any]) -> Dict[str, Any]:
+        destination_path = item["destination_path"]
+        with slots:
+            try:
+                url = upload_bytes(
+                    destination_path,
+                    item["data"],
+                    content_type=item.get("content_type", "image/png"),
+                    upsert=upsert,
+                )
+                result = {"destination_path": destination_path, "url": url, "success": True, "error": None}
+            except Exception as e:
+                result = {"destination_path": destination_path, "url": None, "success": False, "error": str(e)}
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    if not files:
+        return []
+    if len(files) == 1:
+        return [upload_one(files[0])]
+    return list(_get_upload_executor().map(upload_one, files))
+
+
+def upload_file_supabase(file_obj, destination_path: str, content_type: Optional[str] = None) -> str:
     """
     Uploads a file's bytes to Supabase Storage and returns the public URL.
+    The content type defaults to the one implied by the destination extension.
     """
-    print("SUPABASE_BUCKET in main server:", SUPABASE_BUCKET)
+    if content_type is None:
+        content_type = mimetypes.guess_type(destination_path)[0] or "application/octet-stream"
+    logger.debug(f"Uploading {destination_path} to bucket {SUPABASE_BUCKET}")
     try:
-        # Debug: Print bucket info
-        print(f"Using bucket: {SUPABASE_BUCKET}")
-        
         # Ensure we're reading from the beginning of the file
         file_obj.seek(0)
         # Read the file content as bytes
         file_bytes = file_obj.read()
         # Upload the file bytes
-        response = supabase.storage.from_(SUPABASE_BUCKET).upload(destination_path, file_bytes, file_options={"content-type": "image/png"})
+        response = get_supabase().storage.from_(SUPABASE_BUCKET).upload(destination_path, file_bytes, file_options={"content-type": content_type})
         
         # The response structure changed in newer versions of the Supabase Python client
         # Handle both old and new response formats
         if isinstance(response, dict) and response.get("error"):
             raise Exception("Failed to upload file: " + response["error"]["message"])
         
-        # Get the public URL for the uploaded file
-        try:
-            # For newer Supabase client versions
-            public_url = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(destination_path)
-            if isinstance(public_url, str):
-                return public_url
-            elif isinstance(public_url, dict) and "publicURL" in public_url:
-                return public_url["publicURL"]
-            else:
-                # Fallback to constructing the URL manually
-                return f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{destination_path}"
-        except Exception as e:
-            print(f"Error getting public URL: {e}")
-            # Fallback to constructing the URL manually
-            return f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{destination_path}"
+        metrics.UPLOADS.inc(outcome="success")
+        metrics.UPLOAD_BYTES.inc(len(file_bytes))
+        # The public URL is deterministic, so build it locally instead of asking Supabase
+        return build_public_url(destination_path)
     except Exception as e:
-        print(f"Error in upload_file_supabase: {e}")
-        raise
\ No newline at end of file
+        metrics.UPLOADS.inc(outcome="failure")
+        logger.error(f"Error in upload_file_supabase: {e}")
+        raise
@@ -0,0 +1,335 @@
+"""
+Offline benchmarks for the image and question hot paths.
+
+Runs the real FastAPI app in-process with Supabase storage replaced by a local
+in-memory stand-in (the pooled httpx client is pointed at a mock transport, so
+the batch upload code still runs) and MongoDB replaced by the in-memory fake
+collection used by the tests. Pages are synthetic scans generated at several
+resolutions.
+
+    python -m benchmarks.run                         # default matrix
+    python -m benchmarks.run --quick                 # smaller matrix
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --compare before.json   # print deltas against a saved run
+
+Results are written as JSON (default: benchmarks/results/<commit>.json).
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Placeholder settings; nothing leaves the process
+os.environ.setdefault("SUPABASE_URL", "http://storage.local")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+
+import cv2
+import httpx
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app import database, main
+from app.services import image_cache, questions_cache, storage_index
+from app.utils import supabase_client
+from tests.fake_mongo import FakeCollection
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# (name, width, height): A4 at 150, 300 and 600 dpi
+RESOLUTIONS = [("a4-150dpi", 1240, 1754), ("a4-300dpi", 2480, 3508), ("a4-600dpi", 4960, 7016)]
+CROP_COUNTS = [5, 20, 40]
+
+
+class LocalStorage:
+    """Stand-in for the Supabase storage REST API, served through httpx.MockTransport."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.objects[request.url.path] = request.content
+        return httpx.Response(200, json={"Key": request.url.path})
+
+    def install(self):
+        supabase_client._http_client = httpx.Client(
+            base_url=f"{supabase_client.SUPABASE_URL}/storage/v1",
+            transport=httpx.MockTransport(self.handler),
+        )
+
+
+def synthetic_page(width: int, height: int, seed: int = 0) -> bytes:
+    """A white page with dark question blocks made of text-like strokes, PNG encoded."""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width, 3), 250, np.uint8)
+    page += rng.integers(0, 5, page.shape, dtype=np.uint8)  # paper noise
+    margin = width // 12
+    block_height = height // 9
+    for block in range(6):
+        top = margin + block * (block_height + height // 40)
+        cv2.rectangle(page, (margin, top), (width - margin, top + block_height), (30, 30, 30), max(2, width // 600))
+        for line in range(top + 20, top + block_height - 10, max(12, height // 120)):
+            length = int(rng.integers(width // 3, width - 3 * margin))
+            cv2.line(page, (margin + 20, line), (margin + 20 + length, line), (60, 60, 60), max(1, width // 1200))
+    ok, encoded = cv2.imencode(".png", page)
+    return encoded.tobytes()
+
+
+def crop_boxes(width: int, height: int, count: int):
+    rows = max(1, count // 2)
+    row_height = height // rows
+    boxes = []
+    for index in range(count):
+        row, column = divmod(index, 2)
+        left = column * width // 2
+        top = row * row_height
+        boxes.append({
+            "left": left, "top": top, "right": left + width // 2, "bottom": top + row_height,
+            "name": f"q{index}",
+        })
+    return boxes
+
+
+def forget_stored_images(index: FakeCollection):
+    """Forgets stored crops and decoded images so the next request does the full work."""
+    storage_index._known.clear()
+    index.documents.clear()
+    image_cache.cache = image_cache.DecodedImageCache(image_cache.cache.max_bytes, image_cache.cache.ttl_seconds)
+
+
+class RssSampler:
+    """
+    Peak resident set size while running, sampled from /proc/self/statm by a
+    background thread. Unlike tracemalloc it also sees the C allocations of
+    Pillow, libjpeg, libpng/zlib and OpenCV. On platforms without /proc the
+    process-wide ru_maxrss is reported instead.
+    """
+
+    INTERVAL_SECONDS = 0.002
+
+    def __init__(self):
+        self.start_bytes = self.peak_bytes = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.INTERVAL_SECONDS):
+            self.peak_bytes = max(self.peak_bytes, current_rss())
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, current_rss())
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(name, params, iterations, request, reset=None):
+    latencies = []
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            if reset:
+                reset()
+            begin = time.perf_counter()
+            response = request()
+            latencies.append(time.perf_counter() - begin)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{name} {params}: HTTP {response.status_code} {response.text[:200]}")
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "name": name,
+        "params": params,
+        "iterations": iterations,
+        "throughput_rps": iterations / elapsed,
+        "latency_ms": {
+            "p50": 1000 * statistics.median(latencies),
+            "p99": 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+            "mean": 1000 * statistics.fmean(latencies),
+            "min": 1000 * latencies[0],
+            "max": 1000 * latencies[-1],
+        },
+        "peak_rss_bytes": rss.peak_bytes,
+        "rss_growth_bytes": rss.peak_bytes - rss.start_bytes,
+    }
+    print(
+        f"{name:<26} {json.dumps(params):<44} p50 {result['latency_ms']['p50']:9.1f} ms"
+        f"  p99 {result['latency_ms']['p99']:9.1f} ms  {result['throughput_rps']:7.2f} rps"
+        f"  rss {rss.peak_bytes / 2**20:8.1f} MiB (+{result['rss_growth_bytes'] / 2**20:.1f})"
+    )
+    return result
+
+
+def image_scenarios(client, index, resolutions, crop_counts, iterations):
+    results = []
+    reset = lambda: forget_stored_images(index)
+    for label, width, height in resolutions:
+        page = synthetic_page(width, height)
+        files = lambda: {"file": ("page.png", page, "image/png")}
+
+        results.append(measure(
+            "upload", {"page": label}, iterations,
+            lambda: client.post("/images/upload", files=files()), reset,
+        ))
+        results.append(measure(
+            "crop", {"page": label}, iterations,
+            lambda: client.post("/images/crop", files=files(), data={
+                "left": 0, "top": 0, "right": width // 2, "bottom": height // 4,
+            }), reset,
+        ))
+        for count in crop_counts:
+            crops = json.dumps(crop_boxes(width, height, count))
+            results.append(measure(
+                "multicrop", {"page": label, "crops": count}, iterations,
+                lambda: client.post("/images/multicrop", files=files(), data={"crops": crops}), reset,
+            ))
+        results.append(measure(
+            "multicrop_repeat", {"page": label, "crops": crop_counts[-1]}, iterations,
+            lambda: client.post("/images/multicrop", files=files(), data={
+                "crops": json.dumps(crop_boxes(width, height, crop_counts[-1])),
+            }),
+        ))
+        results.append(measure(
+            "auto_crop", {"page": label}, iterations,
+            lambda: client.post("/images/auto_crop", files=files()), reset,
+        ))
+    return results
+
+
+def question_scenarios(client, questions, sizes, iterations):
+    results = []
+    for size in sizes:
+        questions.documents.clear()
+        for index in range(size):
+            questions._insert({
+                "question_id": f"q{index}",
+                "file_name": f"paper_{index % 10}.png",
+                "question_number": index,
+                "question_text": "Which of the following statements is correct? " * 3,
+                "options": ["first option", "second option", "third option", "fourth option"],
+                "isQuestionImage": index % 3 == 0,
+                "question_image": f"https://storage.local/q{index}.png" if index % 3 == 0 else None,
+                "isOptionImage": False,
+                "option_images": [],
+                "section_name": f"Section {index % 4}",
+                "subject": ["Physics", "Chemistry", "Maths"][index % 3],
+                "answer": "A" if index % 2 else "",
+            })
+        ids = [str(document["_id"]) for document in questions.documents]
+
+        # Full listings are cached: the cold scenarios clear the cache before every request
+        results.append(measure(
+            "questions_list", {"documents": size}, iterations,
+            lambda: client.get("/questions", params={"file_name": "paper_1.png"}), questions_cache.cache.clear,
+        ))
+        results.append(measure(
+            "questions_list_all", {"documents": size}, iterations,
+            lambda: client.get("/questions"), questions_cache.cache.clear,
+        ))
+        results.append(measure(
+            "questions_list_all_cached", {"documents": size}, iterations,
+            lambda: client.get("/questions"),
+        ))
+        results.append(measure(
+            "questions_page", {"documents": size, "limit": 100}, iterations,
+            lambda: client.get("/questions", params={"limit": 100}),
+        ))
+        results.append(measure(
+            "questions_stream", {"documents": size}, iterations,
+            lambda: client.get("/questions", params={"stream": "true"}),
+        ))
+        patches = [{"_id": question_id, "fields": {"answer": "B"}} for question_id in ids[:200]]
+        results.append(measure(
+            "questions_bulk_update", {"documents": size, "patches": len(patches)}, iterations,
+            lambda: client.put("/questions/bulk", json=patches),
+        ))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())
+    previous = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in baseline["scenarios"]}
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}):")
+    for result in current["scenarios"]:
+        old = previous.get((result["name"], json.dumps(result["params"], sort_keys=True)))
+        if old is None:
+            continue
+        change = 100 * (result["latency_ms"]["p50"] / old["latency_ms"]["p50"] - 1)
+        print(f"{result['name']:<26} {json.dumps(result['params']):<44} p50 {change:+7.1f}%")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--quick", action="store_true", help="150/300 dpi pages, 5 and 20 crops, fewer questions")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--compare", help="a previous JSON result to compare against")
+    args = parser.parse_args(argv)
+
+    resolutions = RESOLUTIONS[:2] if args.quick else RESOLUTIONS
+    crop_counts = CROP_COUNTS[:2] if args.quick else CROP_COUNTS
+    question_sizes = [1000] if args.quick else [1000, 10000]
+
+    logging.disable(logging.INFO)
+    questions = FakeCollection()
+    index = FakeCollection()
+    main.get_collection = lambda name: questions
+    storage_index.get_collection = lambda name: index
+
+    async def no_indexes():
+        pass
+
+    database.ensure_indexes = no_indexes
+    LocalStorage().install()
+
+    with TestClient(main.app) as client:
+        scenarios = image_scenarios(client, index, resolutions, crop_counts, args.iterations)
+        scenarios += question_scenarios(client, questions, question_sizes, args.iterations)
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "scenarios": scenarios,
+    }
+    output = Path(args.output) if args.output else BACKEND_DIR / "benchmarks" / "results" / f"{result['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main_cli()
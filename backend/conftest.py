@@ -0,0 +1,7 @@
+import os
+
+# The app builds its storage and database clients from these settings; the
+# tests never talk to either service, so placeholders are enough.
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
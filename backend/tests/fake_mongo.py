@@ -0,0 +1,234 @@
+"""
+Small in-memory stand-in for the async pymongo collection API used by the app.
+
+It only understands the query shapes the routes actually send (equality,
+$gt and $in, and the stages and expressions of the summary aggregation) and
+is meant for tests and offline benchmarks, not as a general MongoDB emulator.
+"""
+import copy
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+
+def _get_path(document, path):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return None
+    return value
+
+
+def _set_path(document, path, value):
+    parts = path.split(".")
+    target = document
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+        else:
+            target = target.setdefault(part, {})
+    if isinstance(target, list):
+        index = int(parts[-1])
+        target.extend([None] * (index + 1 - len(target)))
+        target[index] = value
+    else:
+        target[parts[-1]] = value
+
+
+def _matches(document, query):
+    for key, condition in query.items():
+        value = _get_path(document, key)
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            for op, operand in condition.items():
+                if op == "$gt" and not (value is not None and value > operand):
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    if all(not flag for flag in projection.values()):
+        return {k: copy.deepcopy(v) for k, v in document.items() if k not in projection}
+    result = {"_id": document["_id"]} if projection.get("_id", 1) else {}
+    for key, flag in projection.items():
+        if flag and key != "_id" and key in document:
+            result[key] = copy.deepcopy(document[key])
+    return result
+
+
+def _evaluate(expression, document, variables):
+    """Evaluates the aggregation expressions the summary pipeline uses."""
+    if isinstance(expression, str) and expression.startswith("$$"):
+        return variables[expression[2:]]
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_path(document, expression[1:])
+    if isinstance(expression, dict) and len(expression) == 1 and next(iter(expression)).startswith("$"):
+        op, args = next(iter(expression.items()))
+        if op == "$filter":
+            items = _evaluate(args["input"], document, variables)
+            return [item for item in items if _evaluate(args["cond"], document, {**variables, "this": item})]
+        values = [_evaluate(arg, document, variables) for arg in (args if isinstance(args, list) else [args])]
+        if op == "$ifNull":
+            return values[0] if values[0] is not None else values[1]
+        if op == "$cond":
+            return values[1] if values[0] else values[2]
+        if op == "$eq":
+            return values[0] == values[1]
+        if op == "$ne":
+            return values[0] != values[1]
+        if op == "$gt":
+            return values[0] > values[1]
+        if op == "$size":
+            return len(values[0])
+        raise NotImplementedError(op)
+    if isinstance(expression, dict):
+        return {key: _evaluate(value, document, variables) for key, value in expression.items()}
+    return expression
+
+
+def _aggregate(documents, pipeline):
+    for stage in pipeline:
+        (op, spec), = stage.items()
+        if op == "$match":
+            documents = [d for d in documents if _matches(d, spec)]
+        elif op == "$sort":
+            for key, direction in reversed(list(spec.items())):
+                documents = sorted(
+                    documents, key=lambda d: (_get_path(d, key) is not None, _get_path(d, key) or ""),
+                    reverse=direction < 0,
+                )
+        elif op == "$group":
+            groups = {}
+            for document in documents:
+                key = _evaluate(spec["_id"], document, {})
+                group = groups.setdefault(repr(key), {"_id": key})
+                for field, accumulator in spec.items():
+                    if field != "_id":
+                        group[field] = group.get(field, 0) + _evaluate(accumulator["$sum"], document, {})
+            documents = list(groups.values())
+        else:
+            raise NotImplementedError(op)
+    return documents
+
+
+class FakeCursor:
+    def __init__(self, documents, projection):
+        self._documents = documents
+        self._projection = projection
+        self._limit = None
+
+    def sort(self, key, direction=1):
+        self._documents = sorted(self._documents, key=lambda d: _get_path(d, key), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _results(self):
+        documents = self._documents if self._limit is None else self._documents[:self._limit]
+        return [_project(d, self._projection) for d in documents]
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results if length is None else results[:length]
+
+    async def close(self):
+        pass
+
+
+class FakeCollection:
+    def __init__(self, documents=None):
+        self.documents = []
+        self.indexes = []
+        self.calls = []
+        for document in documents or []:
+            self._insert(document)
+
+    def _insert(self, document):
+        document.setdefault("_id", ObjectId())
+        self.documents.append(copy.deepcopy(document))
+        return document["_id"]
+
+    def _update(self, query, update):
+        for document in self.documents:
+            if _matches(document, query):
+                before = copy.deepcopy(document)
+                for key, value in update.get("$set", {}).items():
+                    _set_path(document, key, value)
+                return 1, int(before != document)
+        return 0, 0
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.calls.append(("find", query))
+        return FakeCursor([d for d in self.documents if _matches(d, query or {})], projection)
+
+    async def find_one(self, query=None, projection=None, **kwargs):
+        self.calls.append(("find_one", query))
+        for document in self.documents:
+            if _matches(document, query or {}):
+                return _project(document, projection)
+        return None
+
+    async def aggregate(self, pipeline, **kwargs):
+        self.calls.append(("aggregate", pipeline))
+        return FakeCursor(_aggregate(copy.deepcopy(self.documents), pipeline), None)
+
+    async def insert_one(self, document):
+        self.calls.append(("insert_one", None))
+        return SimpleNamespace(inserted_id=self._insert(document))
+
+    async def insert_many(self, documents, ordered=True):
+        self.calls.append(("insert_many", len(documents)))
+        existing = {d["_id"] for d in self.documents}
+        inserted_ids, errors = [], []
+        for index, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            if document["_id"] in existing:
+                errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key error"})
+                if ordered:
+                    break
+                continue
+            existing.add(self._insert(document))
+            inserted_ids.append(document["_id"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted_ids)})
+        return SimpleNamespace(inserted_ids=inserted_ids)
+
+    async def bulk_write(self, requests, ordered=True):
+        self.calls.append(("bulk_write", len(requests)))
+        matched = modified = 0
+        for request in requests:
+            request_matched, request_modified = self._update(request._filter, request._doc)
+            matched += request_matched
+            modified += request_modified
+        return SimpleNamespace(matched_count=matched, modified_count=modified)
+
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append(("update_one", query))
+        matched, modified = self._update(query, update)
+        return SimpleNamespace(matched_count=matched, modified_count=modified)
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+        return kwargs.get("name")
@@ -1,5 +1,14 @@
+import io
+import json
+from collections import OrderedDict
+
+import pytest
 from fastapi.testclient import TestClient
+from PIL import Image
+
 from app.main import app
+from app.services import image_cache, storage_index
+from tests.fake_mongo import FakeCollection
 
 client = TestClient(app)
 
@@ -9,4 +18,656 @@ def test_upload_image():
 
 def test_crop_image():
     # Test implementation here
-    pass 
\ No newline at end of file
+    pass
+
+def _png_bytes(width=120, height=80):
+    image = Image.new("RGB", (width, height), "white")
+    for x in range(width):
+        image.putpixel((x, x % height), (x, 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Replaces Supabase and the MongoDB storage index with in-memory fakes."""
+    uploaded = []
+
+    def fake_batch(files, on_result=None, **kwargs):
+        uploaded.extend(files)
+        results = [
+            {"destination_path": f["destination_path"], "url": f"https://storage.test/{f['destination_path']}",
+             "success": True, "error": None}
+            for f in files
+        ]
+        for result in results:
+            if on_result:
+                on_result(result)
+        return results
+
+    monkeypatch.setattr(storage_index, "upload_files_batch", fake_batch)
+    monkeypatch.setattr(storage_index, "get_collection", lambda name: index)
+    monkeypatch.setattr(storage_index, "_known", OrderedDict())
+    index = FakeCollection()
+    return uploaded
+
+def test_upload_stores_mpo_camera_jpegs_as_jpeg(storage):
+    buffer = io.BytesIO()
+    frames = [Image.new("RGB", (40, 30), "red"), Image.new("RGB", (40, 30), "blue")]
+    frames[0].save(buffer, format="MPO", save_all=True, append_images=frames[1:])
+    assert Image.open(io.BytesIO(buffer.getvalue())).format == "MPO"
+
+    response = client.post("/images/upload", files={"file": ("photo.jpg", buffer.getvalue(), "image/jpeg")})
+    assert response.status_code == 200
+    assert storage[-1]["destination_path"].endswith(".jpg")
+    assert storage[-1]["content_type"] == "image/jpeg"
+
+def test_upload_stores_original_bytes_without_reencoding(storage):
+    import mmap
+    import os
+
+    noisy = Image.frombytes("RGB", (700, 700), os.urandom(700 * 700 * 3))
+    buffer = io.BytesIO()
+    noisy.save(buffer, format="PNG", compress_level=1)
+    original = buffer.getvalue()
+    assert len(original) > 1024 * 1024
+
+    response = client.post("/images/upload", files={"file": ("scan.png", original, "image/png")})
+    assert response.status_code == 200
+    stored = storage[-1]["data"]
+    # Large bodies are memory-mapped from the spool file and stored as sent
+    assert isinstance(stored, mmap.mmap)
+    assert stored[:] == original
+    assert response.json()["url"].endswith(".png")
+
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("scan.png", original, "image/png")},
+        data={"crops": json.dumps([{"left": 100, "top": 50, "right": 300, "bottom": 120}]), "output_format": "png"},
+    )
+    assert response.status_code == 200
+    cropped = Image.open(io.BytesIO(storage[-1]["data"]))
+    assert cropped.tobytes() == noisy.crop((100, 50, 300, 120)).tobytes()
+
+    assert client.post("/images/upload", files={"file": ("scan.png", b"not an image", "image/png")}).status_code == 400
+
+def test_multicrop_keeps_crop_order(storage):
+    crops = [
+        {"left": i * 10, "top": 0, "right": i * 10 + 10 + i, "bottom": 40, "name": f"q{i}"}
+        for i in range(8)
+    ]
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(), "image/png")},
+        data={"crops": json.dumps(crops)},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert [c["name"] for c in body["crops"]] == [f"q{i}" for i in range(8)]
+    assert [c["index"] for c in body["crops"]] == list(range(8))
+    assert len(storage) == 8
+
+def test_multicrop_reuses_stored_crops(storage):
+    crops = [
+        {"left": 0, "top": 0, "right": 50, "bottom": 40, "name": "same"},
+        {"left": 0, "top": 0, "right": 50, "bottom": 40, "name": "same"},
+        {"left": 50, "top": 0, "right": 100, "bottom": 40, "name": "other"},
+    ]
+    def post():
+        return client.post(
+            "/images/multicrop",
+            files={"file": ("page.png", _png_bytes(), "image/png")},
+            data={"crops": json.dumps(crops)},
+        ).json()
+
+    first = post()
+    assert len(storage) == 2
+    assert first["crops"][0]["url"] == first["crops"][1]["url"] != first["crops"][2]["url"]
+    assert first["crops"][0]["filename"].startswith("crops/")
+
+    second = post()
+    assert len(storage) == 2
+    assert all(c["deduplicated"] for c in second["crops"])
+    assert [c["url"] for c in second["crops"]] == [c["url"] for c in first["crops"]]
+
+def test_multicrop_reports_stage_timings(storage):
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(97, 61), "image/png")},
+        data={"crops": json.dumps([{"left": 0, "top": 0, "right": 30, "bottom": 30}])},
+    )
+    assert response.status_code == 200
+    stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    for stage in ("read", "digest", "index_lookup", "decode", "crop_encode", "upload", "total"):
+        assert stage in stages
+
+    exposition = client.get("/metrics").text
+    assert 'multicrop_stage_duration_seconds_count{stage="crop_encode"}' in exposition
+    assert 'route="/images/multicrop",status="200"' in exposition
+
+def test_multicrop_output_format_presets(storage):
+    crops = json.dumps([{"left": 0, "top": 0, "right": 60, "bottom": 40}])
+
+    def post(**fields):
+        response = client.post(
+            "/images/multicrop",
+            files={"file": ("page.png", _png_bytes(), "image/png")},
+            data={"crops": crops, **fields},
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["crops"][0]
+
+    original = post()
+    webp = post(output_format="webp", quality="70", speed="fast")
+    jpeg = post(output_format="jpeg")
+    assert original["filename"].endswith(".png")
+    assert webp["filename"].endswith(".webp")
+    assert jpeg["filename"].endswith(".jpg")
+    # Different encodings of the same region never share a storage key
+    assert len({original["filename"], webp["filename"], jpeg["filename"]}) == 3
+    assert post(output_format="webp", quality="71", speed="fast")["filename"] != webp["filename"]
+
+    stored = {f["destination_path"]: f for f in storage}
+    assert stored[webp["filename"]]["content_type"] == "image/webp"
+    assert stored[jpeg["filename"]]["content_type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(stored[webp["filename"]]["data"])).format == "WEBP"
+
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(), "image/png")},
+        data={"crops": crops, "output_format": "jpeg", "quality": "120"},
+    )
+    assert response.status_code == 400
+
+def test_multicrop_thumbnails_recorded_on_questions(storage, monkeypatch):
+    from bson import ObjectId
+    from app.services import question_images
+
+    question_id = ObjectId()
+    questions = FakeCollection([{"_id": question_id, "question_image": None}])
+    monkeypatch.setattr(question_images, "get_collection", lambda name: questions)
+    crops = [
+        {"left": 0, "top": 0, "right": 120, "bottom": 80, "question_id": str(question_id)},
+        {"left": 0, "top": 0, "right": 40, "bottom": 40, "question_id": str(question_id),
+         "type": "option", "option_index": 1},
+    ]
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(), "image/png")},
+        data={"crops": json.dumps(crops), "thumbnail_widths": "32,64,256"},
+    )
+    assert response.status_code == 200, response.text
+    body = response.json()
+    question_crop, option_crop = body["crops"]
+    # No upscaled derivatives: 256 is wider than both crops
+    assert set(question_crop["derivatives"]) == {"32", "64"}
+    assert set(option_crop["derivatives"]) == {"32"}
+    assert question_crop["derivatives"]["64"].endswith(question_crop["filename"].replace(".png", "_w64.png"))
+    stored = {f["destination_path"]: f["data"] for f in storage}
+    assert Image.open(io.BytesIO(stored[question_crop["filename"].replace(".png", "_w64.png")])).size == (64, 43)
+
+    assert body["questions_updated"] == 1
+    document = questions.documents[0]
+    assert document["question_image_derivatives"] == [{"url": question_crop["url"], **question_crop["derivatives"]}]
+    assert document["option_image_derivatives"]["1"] == [{"url": option_crop["url"], **option_crop["derivatives"]}]
+
+def test_multicrop_derivatives_invalidate_cached_question_lists(storage, monkeypatch):
+    from bson import ObjectId
+    from app import main
+    from app.services import question_images, questions_cache
+
+    question_id = ObjectId()
+    questions = FakeCollection([{"_id": question_id, "file_name": "page.png", "question_image": None}])
+    monkeypatch.setattr(question_images, "get_collection", lambda name: questions)
+    monkeypatch.setattr(main, "get_collection", lambda name: questions)
+    questions_cache.cache.clear()
+
+    listed = client.get("/questions", params={"file_name": "page.png"})
+    assert "question_image_derivatives" not in listed.json()["questions"][0]
+
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(91, 67), "image/png")},
+        data={
+            "crops": json.dumps([{"left": 0, "top": 0, "right": 80, "bottom": 60, "question_id": str(question_id)}]),
+            "thumbnail_widths": "32",
+        },
+    )
+    assert response.json()["questions_updated"] == 1
+
+    fresh = client.get("/questions", params={"file_name": "page.png"}, headers={"If-None-Match": listed.headers["etag"]})
+    assert fresh.status_code == 200
+    [derivatives] = fresh.json()["questions"][0]["question_image_derivatives"]
+    assert set(derivatives) == {"url", "32"}
+
+def test_multicrop_streams_zip_without_storing(storage):
+    import zipfile
+
+    crops = [
+        {"left": 0, "top": 0, "right": 30, "bottom": 20, "name": "q/1"},
+        {"left": 10, "top": 10, "right": 50, "bottom": 40},
+    ]
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(), "image/png")},
+        data={"crops": json.dumps(crops), "response_mode": "zip"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == ["000_q_1.png", "001_crop_1.png", "manifest.json"]
+    assert Image.open(archive.open("001_crop_1.png")).size == (40, 30)
+    assert storage == []
+
+    pages = [("a.png", _png_bytes()), ("b.png", _png_bytes(90, 70)), ("c.png", b"not an image")]
+    response = client.post(
+        "/images/multicrop/archive",
+        files=[("files", (name, data, "image/png")) for name, data in pages[:2]],
+        data={"crops": json.dumps([crops, crops[:1]])},
+    )
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == [
+        "001_a/000_q_1.png", "001_a/001_crop_1.png", "002_b/000_q_1.png", "manifest.json",
+    ]
+    manifest = json.loads(archive.read("manifest.json"))
+    assert [page["filename"] for page in manifest["pages"]] == ["a.png", "b.png"]
+    assert manifest["pages"][0]["crops"][1]["entry"] == "001_a/001_crop_1.png"
+    assert storage == []
+
+    # A page without crops is listed without an error; a null name gets the default one
+    response = client.post(
+        "/images/multicrop/archive",
+        files=[("files", (name, data, "image/png")) for name, data in pages[:2]],
+        data={"crops": json.dumps([[dict(crops[0], name=None)], []])},
+    )
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == ["001_a/000_crop_0.png", "manifest.json"]
+    manifest = json.loads(archive.read("manifest.json"))
+    assert manifest["pages"][1]["crops"] == [] and manifest["pages"][1]["error"] is None
+
+    response = client.post(
+        "/images/multicrop/archive",
+        files=[("files", (name, data, "image/png")) for name, data in pages],
+        data={"crops": json.dumps(crops)},
+    )
+    assert response.status_code == 400
+
+def test_multicrop_rejects_missing_coordinates():
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(), "image/png")},
+        data={"crops": '[{"left": 0, "top": 0, "right": 10}]'},
+    )
+    assert response.status_code == 400
+
+def test_detect_regions_is_resolution_independent():
+    import numpy as np
+    from app.services import detection
+
+    def page(scale):
+        image = np.full((1100 * scale, 850 * scale, 3), 255, np.uint8)
+        image[100 * scale:300 * scale, 80 * scale:700 * scale] = 0
+        image[500 * scale:900 * scale, 100 * scale:400 * scale] = 0
+        return image
+
+    small = detection.detect_regions(page(1))
+    large = detection.detect_regions(page(4), max_side=1100)
+    assert len(small) == len(large) == 2
+    for (x1, y1, w1, h1), (x2, y2, w2, h2) in zip(small, large):
+        assert abs(x2 - 4 * x1) <= 8 and abs(y2 - 4 * y1) <= 8
+        assert abs(w2 - 4 * w1) <= 8 and abs(h2 - 4 * h1) <= 8
+
+def test_large_uploads_decode_only_the_cropped_region(storage):
+    from app.services import crop_engine
+
+    page = Image.new("RGB", (400, 1200), "white")
+    for y in range(0, 1200, 7):
+        page.paste((y % 256, 40, 200), (y % 300, y, y % 300 + 90, y + 4))
+    box = (50, 100, 250, 220)
+    for save_options in ({"format": "JPEG", "quality": 90}, {"format": "TIFF", "tiffinfo": {278: 64}}):
+        buffer = io.BytesIO()
+        page.save(buffer, **save_options)
+        data = buffer.getvalue()
+
+        region, (ox, oy) = crop_engine.load_region(data, box)
+        assert region.height < page.height // 2
+        expected = Image.open(io.BytesIO(data)).convert("RGB").crop(box)
+        assert region.convert("RGB").crop((box[0] - ox, box[1] - oy, box[2] - ox, box[3] - oy)).tobytes() == expected.tobytes()
+
+        response = client.post(
+            "/images/multicrop",
+            files={"file": ("page", data, "application/octet-stream")},
+            data={"crops": json.dumps([dict(zip(("left", "top", "right", "bottom"), box))]), "output_format": "png"},
+        )
+        assert response.status_code == 200
+        assert image_cache.cache.get(storage_index.content_digest(data)) is None
+        assert Image.open(io.BytesIO(storage[-1]["data"])).convert("RGB").tobytes() == expected.tobytes()
+
+def test_arrange_boxes_merges_and_orders_columns():
+    from app.services import detection
+
+    boxes = [
+        (520, 400, 400, 200),   # right column, second
+        (40, 700, 400, 150),    # left column, third
+        (-10, 60, 940, 100),    # header spanning both columns, clipped at x=0
+        (40, 250, 400, 300),    # left column, first
+        (60, 270, 100, 100),    # nested in the one above
+        (520, 220, 400, 160),   # right column, first
+        (45, 690, 400, 150),    # near-duplicate of the third left box
+        (990, 990, 50, 50),     # mostly off the page
+    ]
+    assert detection.arrange_boxes(boxes, 1000, 1000) == [
+        (0, 60, 930, 100),
+        (40, 250, 400, 300),
+        (40, 690, 405, 160),
+        (520, 220, 400, 160),
+        (520, 400, 400, 200),
+        (990, 990, 10, 10),
+    ]
+    assert detection.arrange_boxes([], 1000, 1000) == []
+
+def test_auto_crop_detect_only_returns_boxes_without_storing(storage):
+    page = Image.new("RGB", (850, 1100), "white")
+    page.paste((0, 0, 0), (80, 500, 400, 900))
+    page.paste((0, 0, 0), (450, 500, 800, 900))
+    page.paste((0, 0, 0), (80, 100, 800, 300))
+    buffer = io.BytesIO()
+    page.save(buffer, format="JPEG")
+
+    response = client.post(
+        "/images/auto_crop",
+        files={"file": ("page.jpg", buffer.getvalue(), "image/jpeg")},
+        data={"detect_only": "true", "max_side": "400"},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["width"], body["height"], body["num_boxes"]) == (850, 1100, 3)
+    expected = [(80, 100, 800, 300), (80, 500, 400, 900), (450, 500, 800, 900)]
+    for box, (left, top, right, bottom) in zip(body["boxes"], expected):
+        assert abs(box["left"] - left) <= 8 and abs(box["top"] - top) <= 8
+        assert abs(box["right"] - right) <= 8 and abs(box["bottom"] - bottom) <= 8
+    assert storage == []
+
+def test_admission_queues_then_rejects():
+    import asyncio
+    from app.services import admission
+
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrent=4, max_bytes=1000, queue_size=1, timeout_seconds=0.05)
+        big = await controller.reservation(800).acquire()
+        # Over the byte budget: waits in the queue, and the queue is then full
+        waiting = asyncio.ensure_future(controller.reservation(400).acquire())
+        await asyncio.sleep(0)
+        assert controller.stats()["queue_depth"] == 1
+        try:
+            await controller.reservation(10).acquire()
+            assert False, "queue should be full"
+        except admission.Saturated as e:
+            assert e.reason == "queue_full"
+        big.release()
+        second = await waiting
+        assert (controller.in_flight, controller.reserved_bytes) == (1, 400)
+
+        # A request larger than the whole budget still runs once alone, but times out while others hold it
+        try:
+            await controller.reservation(5000).acquire()
+            assert False, "should time out"
+        except admission.Saturated as e:
+            assert e.reason == "timeout" and e.retry_after == 1
+        second.release()
+        with await controller.reservation(5000).acquire() as alone:
+            assert alone.nbytes == 1000
+        assert controller.stats()["in_flight"] == controller.stats()["reserved_bytes"] == 0
+
+    asyncio.run(scenario())
+
+def test_image_endpoints_answer_503_when_saturated(storage, monkeypatch):
+    import asyncio
+    from app.services import admission
+
+    controller = admission.AdmissionController(max_concurrent=1, max_bytes=10 ** 9, queue_size=0, timeout_seconds=1)
+    monkeypatch.setattr(admission, "controller", controller)
+    held = asyncio.run(controller.reservation(0).acquire())
+
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(), "image/png")},
+        data={"crops": json.dumps([{"left": 0, "top": 0, "right": 10, "bottom": 10}])},
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert 'multicrop_admission_rejections_total{reason="queue_full"}' in client.get("/metrics").text
+
+    held.release()
+    response = client.post(
+        "/images/multicrop",
+        files={"file": ("page.png", _png_bytes(), "image/png")},
+        data={"crops": json.dumps([{"left": 0, "top": 0, "right": 10, "bottom": 10}]), "response_mode": "zip"},
+    )
+    assert response.status_code == 200
+    assert client.get("/images/admission/stats").json()["in_flight"] == 0
+
+def test_job_submission_answers_503_when_saturated(storage, monkeypatch):
+    import asyncio
+    from app.services import admission, jobs
+
+    # Queued jobs hold their uploads, so submissions are turned away once the byte budget is exhausted
+    controller = admission.AdmissionController(max_concurrent=4, max_bytes=1000, queue_size=0, timeout_seconds=1)
+    monkeypatch.setattr(admission, "controller", controller)
+    held = asyncio.run(controller.reservation(1000).acquire())
+
+    async def unexpected_submit(*args, **kwargs):
+        raise AssertionError("a rejected job must not be queued")
+
+    monkeypatch.setattr(jobs.manager, "submit", unexpected_submit)
+    for endpoint, data in [
+        ("/images/jobs/multicrop", {"crops": json.dumps([{"left": 0, "top": 0, "right": 10, "bottom": 10}])}),
+        ("/images/jobs/auto_crop", {}),
+    ]:
+        response = client.post(endpoint, files={"file": ("page.png", _png_bytes(), "image/png")}, data=data)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+    held.release()
+    assert controller.stats()["in_flight"] == 0
+
+def test_job_workers_do_not_inherit_request_timings():
+    import asyncio
+    from app.services import jobs
+    from app.utils import metrics
+
+    async def scenario():
+        # The request that happens to start the workers
+        timings = metrics.start_request_timing()
+        manager = jobs.JobManager(jobs.InMemoryJobStore(), 1, 10, 60)
+        seen = []
+
+        async def runner(context):
+            with metrics.stage("job_work"):
+                seen.append(metrics._request_timings.get())
+            return {}
+
+        for _ in range(3):
+            job = await manager.submit("test", runner)
+            while (await manager.store.get(job["id"]))["status"] != "completed":
+                await asyncio.sleep(0.01)
+        assert seen == [None, None, None]
+        assert timings == []
+
+    asyncio.run(scenario())
+
+def test_queued_jobs_take_a_processing_slot_only_when_they_start(monkeypatch):
+    import asyncio
+    from app.api.endpoints import images
+    from app.services import admission, jobs
+
+    controller = admission.AdmissionController(max_concurrent=1, max_bytes=1000, queue_size=0, timeout_seconds=0.05)
+    monkeypatch.setattr(admission, "controller", controller)
+    monkeypatch.setattr(jobs, "manager", jobs.JobManager(jobs.InMemoryJobStore(), 1, 10, 60))
+
+    async def scenario():
+        busy = await controller.reservation(0).acquire()
+        # The upload's bytes are reserved without a slot, so submitting does not wait for `busy`
+        held = await controller.reservation(300, slot=False).acquire()
+        started = asyncio.Event()
+
+        async def runner(context):
+            started.set()
+            return {"ok": True}
+
+        submitted = await images.submit_job("test", runner, 0, held, 200)
+        await asyncio.sleep(0.1)
+        assert not started.is_set()
+        assert controller.stats()["in_flight"] == 1 and controller.stats()["reserved_bytes"] == 300
+
+        busy.release()
+        await asyncio.wait_for(started.wait(), 1)
+        while (await jobs.manager.store.get(submitted["job_id"]))["status"] != "completed":
+            await asyncio.sleep(0.01)
+        assert controller.stats()["in_flight"] == controller.stats()["reserved_bytes"] == 0
+
+    asyncio.run(scenario())
+
+def test_registered_source_is_cropped_by_id(storage):
+    image_cache.cache.remove(storage_index.content_digest(_png_bytes()))
+    registered = client.post("/images/sources", files={"file": ("page.png", _png_bytes(), "image/png")})
+    assert registered.status_code == 200
+    source_id = registered.json()["source_id"]
+
+    hits = image_cache.cache.hits
+    response = client.post(
+        "/images/multicrop",
+        data={"source_id": source_id, "crops": json.dumps([{"left": 0, "top": 0, "right": 20, "bottom": 20}])},
+    )
+    assert response.status_code == 200
+    assert response.json()["crops"][0]["name"] == "crop_0"
+    assert image_cache.cache.hits == hits + 1
+
+    assert client.delete(f"/images/sources/{source_id}").status_code == 200
+    response = client.post("/images/crop", data={"source_id": source_id, "left": 0, "top": 0, "right": 5, "bottom": 5})
+    assert response.status_code == 404
+
+def test_decoded_image_cache_limits():
+    cache = image_cache.DecodedImageCache(max_bytes=2 * 10 * 10 * 3, ttl_seconds=60)
+    for name in "abc":
+        cache.put(image_cache.SourceImage(source_id=name, image=Image.new("RGB", (10, 10)), format="PNG"))
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+    cache.ttl_seconds = -1
+    assert cache.get("c") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_pdf_pages_stream_as_ndjson(storage, tmp_path, monkeypatch):
+    import os
+    import pypdfium2 as pdfium
+    from app.services import pdf_ingest
+
+    spooled = []
+    spool_to_disk = pdf_ingest.spool_to_disk
+
+    async def recording_spool(file):
+        spooled.append(await spool_to_disk(file))
+        return spooled[-1]
+
+    monkeypatch.setattr(pdf_ingest, "spool_to_disk", recording_spool)
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(3):
+        pdf.new_page(200, 300)
+    path = tmp_path / "paper.pdf"
+    pdf.save(str(path))
+
+    response = client.post(
+        "/images/pdf",
+        files={"file": ("paper.pdf", path.read_bytes(), "application/pdf")},
+        data={"dpi": "72"},
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {"type": "document", "filename": "paper.pdf", "num_pages": 3, "dpi": 72}
+    assert lines[-1] == {"type": "done"}
+    pages = sorted(lines[1:-1], key=lambda line: line["page"])
+    assert [p["page"] for p in pages] == [1, 2, 3]
+    assert all((p["width"], p["height"]) == (200, 300) and p["url"] for p in pages)
+    assert len(storage) == 3
+    assert client.get("/images/admission/stats").json()["in_flight"] == 0
+    assert spooled and not os.path.exists(spooled[0])
+
+def test_pdf_recovers_from_a_dead_render_worker(storage, tmp_path):
+    import os
+    import signal
+    import pypdfium2 as pdfium
+    from app.services import pdf_ingest
+
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(2):
+        pdf.new_page(200, 300)
+    path = tmp_path / "paper.pdf"
+    pdf.save(str(path))
+
+    def ingest():
+        response = client.post(
+            "/images/pdf", files={"file": ("paper.pdf", path.read_bytes(), "application/pdf")},
+            data={"dpi": "72", "upload": "false"},
+        )
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[-1] == {"type": "done"}
+        return sorted(lines[1:-1], key=lambda line: line["page"])
+
+    # Kill the workers (as the OOM killer would): the pages fail in the stream instead of the request
+    pool = pdf_ingest.get_process_pool()
+    pool.submit(os.getpid).result()
+    for process in list(pool._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+    pages = ingest()
+    assert [p["page"] for p in pages] == [1, 2]
+    assert all("Rendering worker failed" in p["error"] for p in pages)
+
+    # The next document gets a fresh pool
+    assert all("error" not in p and p["width"] == 200 for p in ingest())
+
+def test_pdf_rejects_non_pdf(storage):
+    response = client.post("/images/pdf", files={"file": ("page.png", _png_bytes(), "image/png")})
+    assert response.status_code == 400
+
+def test_multicrop_job_streams_progress(storage, monkeypatch):
+    from app import database
+    from app.services import jobs
+
+    async def no_indexes():
+        pass
+
+    monkeypatch.setattr(database, "ensure_indexes", no_indexes)
+    crops = [{"left": i * 10, "top": 0, "right": i * 10 + 10, "bottom": 30, "name": f"q{i}"} for i in range(5)]
+    with TestClient(app) as live_client:
+        submitted = live_client.post(
+            "/images/jobs/multicrop",
+            files={"file": ("page.png", _png_bytes(), "image/png")},
+            data={"crops": json.dumps(crops)},
+        )
+        assert submitted.status_code == 202
+        job_id = submitted.json()["job_id"]
+
+        with live_client.stream("GET", f"/images/jobs/{job_id}/events") as response:
+            events = [
+                json.loads(line[len("data: "):]) for line in response.iter_lines() if line.startswith("data: ")
+            ]
+
+        assert events[0] == {"type": "status", "status": "running"}
+        assert events[-1]["type"] == "completed"
+        assert [c["name"] for c in events[-1]["result"]["crops"]] == [f"q{i}" for i in range(5)]
+        stored = [e for e in events if e["type"] == "progress" and e["stage"] == "store"]
+        assert sorted(e["done"] for e in stored) == [1, 2, 3, 4, 5]
+
+        job = live_client.get(f"/images/jobs/{job_id}").json()
+        assert job["status"] == "completed" and job["expires_at"] is not None
+        # The job held its admission slot until it finished
+        assert live_client.get("/images/admission/stats").json()["in_flight"] == 0
+        stats = live_client.get("/images/jobs/stats").json()
+        assert stats["queued"] == 0 and stats["workers"] == jobs.manager.workers
@@ -0,0 +1,196 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import questions_cache
+from tests.fake_mongo import FakeCollection
+
+client = TestClient(main.app)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def questions(monkeypatch):
+    collection = FakeCollection(
+        [{"question_id": f"q{i}", "file_name": "a.png" if i % 2 else "b.png", "question_text": f"text {i}"}
+         for i in range(7)]
+    )
+    monkeypatch.setattr(main, "get_collection", lambda name: collection)
+    questions_cache.cache.clear()
+    return collection
+
+
+def test_listing_records_one_db_stage_per_query(questions, monkeypatch):
+    from app import database
+
+    def find_count():
+        for line in client.get("/metrics").text.splitlines():
+            if line.startswith('multicrop_stage_duration_seconds_count{stage="db.find"}'):
+                return float(line.split()[-1])
+        return 0.0
+
+    monkeypatch.setattr(main, "get_collection", lambda name: database.InstrumentedCollection(questions, name))
+    before = find_count()
+    response = client.get("/questions")
+    assert response.status_code == 200
+    assert len(response.json()["questions"]) == 7
+    assert "db-find" in response.headers["server-timing"]
+    assert find_count() - before == 1
+
+
+def test_list_questions_filters_by_file_name(questions):
+    response = client.get("/questions", params={"file_name": "a.png"})
+    assert response.status_code == 200
+    body = response.json()
+    assert [q["question_id"] for q in body["questions"]] == ["q1", "q3", "q5"]
+    assert all(isinstance(q["_id"], str) for q in body["questions"])
+    assert "next_cursor" not in body
+
+
+def test_list_questions_revalidates_with_etag(questions):
+    first = client.get("/questions", params={"file_name": "a.png"})
+    etag = first.headers["etag"]
+    scans = sum(1 for call in questions.calls if call[0] == "find")
+
+    cached = client.get("/questions", params={"file_name": "a.png"}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert sum(1 for call in questions.calls if call[0] == "find") == scans
+
+    # Writes to another file's questions leave this entry alone
+    other = next(q for q in questions.documents if q["file_name"] == "b.png")
+    client.put(f"/questions/{other['_id']}", json={"question_text": "edited"})
+    assert client.get("/questions", params={"file_name": "a.png"}, headers={"If-None-Match": etag}).status_code == 304
+
+    # Editing a listed question invalidates it
+    listed = next(q for q in questions.documents if q["file_name"] == "a.png")
+    client.put(f"/questions/{listed['_id']}", json={"question_text": "edited"})
+    fresh = client.get("/questions", params={"file_name": "a.png"}, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+    assert "edited" in [q["question_text"] for q in fresh.json()["questions"]]
+
+    # So does a new question for the same file
+    client.post("/questions", json={"question_id": "q-new", "file_name": "a.png"})
+    body = client.get("/questions", params={"file_name": "a.png"}).json()
+    assert "q-new" in [q["question_id"] for q in body["questions"]]
+    assert questions_cache.cache.stats()["not_modified"] == 2
+
+
+def test_questions_summary_counts_per_file_section_and_subject(questions):
+    questions.documents[:] = []
+    rows = [
+        ("a.png", "A", "Physics", "https://img/1.png", [None, "https://img/o.png"], "B"),
+        ("a.png", "A", "Physics", None, [], ""),
+        ("a.png", "A", "Chemistry", "", ["", None], None),
+        ("a.png", "B", "Physics", "https://img/2.png", ["https://img/o2.png"], "C"),
+        ("b.png", "A", "Physics", None, None, "A"),
+    ]
+    for file_name, section, subject, image, options, answer in rows:
+        questions._insert({
+            "file_name": file_name, "section_name": section, "subject": subject, "question_image": image,
+            "isQuestionImage": bool(image), "option_images": options, "isOptionImage": bool(options), "answer": answer,
+        })
+
+    body = client.get("/questions/summary").json()
+    assert body["totals"]["questions"] == 5
+    assert [f["file_name"] for f in body["files"]] == ["a.png", "b.png"]
+    first = body["files"][0]
+    assert (first["questions"], first["with_question_image"], first["without_question_image"]) == (4, 2, 2)
+    assert (first["with_option_images"], first["option_image_enabled"], first["answered"]) == (2, 3, 2)
+    assert [(g["section_name"], g["subject"], g["questions"]) for g in first["groups"]] == [
+        ("A", "Chemistry", 1), ("A", "Physics", 2), ("B", "Physics", 1),
+    ]
+
+    single = client.get("/questions/summary", params={"file_name": "b.png"}).json()
+    assert [f["file_name"] for f in single["files"]] == ["b.png"]
+    assert single["totals"]["answered"] == 1 and single["totals"]["with_option_images"] == 0
+    assert all(call[0] != "find" for call in questions.calls)
+
+
+def test_list_questions_paginates_with_cursor(questions):
+    seen = []
+    after = None
+    while True:
+        params = {"limit": 3, "fields": "question_id"}
+        if after:
+            params["after"] = after
+        body = client.get("/questions", params=params).json()
+        seen.extend(q["question_id"] for q in body["questions"])
+        assert all(set(q) == {"_id", "question_id"} for q in body["questions"])
+        after = body["next_cursor"]
+        if after is None:
+            break
+    assert seen == [f"q{i}" for i in range(7)]
+
+
+def test_list_questions_streams_ndjson(questions):
+    response = client.get("/questions", params={"file_name": "b.png", "stream": "true"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [q["question_id"] for q in lines] == ["q0", "q2", "q4", "q6"]
+
+
+def test_list_questions_rejects_bad_cursor(questions):
+    assert client.get("/questions", params={"after": "nope"}).status_code == 400
+
+
+def test_bulk_update_applies_patches_in_chunks(questions):
+    ids = [str(d["_id"]) for d in questions.documents]
+    patches = [
+        {"_id": ids[0], "fields": {"question_text": "changed"}},
+        {"_id": ids[1], "fields": {"question_text": "text 1"}},
+        {"_id": "000000000000000000000000", "fields": {"question_text": "x"}},
+        {"_id": "bad", "fields": {"question_text": "x"}},
+        {"_id": ids[2], "fields": {"question_image": "https://storage.test/q2.png"}},
+    ]
+    response = client.put("/questions/bulk", params={"chunk_size": 2}, json=patches)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["matched_count"] == 3
+    assert body["modified_count"] == 2
+    assert [r["matched"] for r in body["results"]] == [True, True, False, False, True]
+    assert [r["modified"] for r in body["results"]] == [True, False, False, False, True]
+    assert body["results"][3]["error"] == "Invalid _id"
+    assert questions.documents[0]["question_text"] == "changed"
+    assert sum(1 for call in questions.calls if call[0] == "bulk_write") == 2
+
+
+def test_bulk_create_reports_per_item_errors(questions):
+    response = client.post(
+        "/questions/bulk",
+        params={"chunk_size": 2},
+        json=[{"_id": "dup", "question_id": "n1"}, {"_id": "dup", "question_id": "n2"}, {"question_id": "n3"}],
+    )
+    assert response.status_code == 207
+    body = response.json()
+    assert body["failed_count"] == 1
+    assert [r["inserted_id"] is not None for r in body["results"]] == [True, False, True]
+    assert "duplicate key" in body["results"][1]["error"]
+    assert len(body["inserted_ids"]) == 2
+
+
+def test_question_routes_cold_start_without_image_libraries():
+    # A fresh interpreter, as on a serverless cold start
+    script = """
+import sys
+from fastapi.testclient import TestClient
+from app import main
+from app.services import questions_cache
+from tests.fake_mongo import FakeCollection
+
+main.get_collection = lambda name: FakeCollection([{"question_id": "q1", "file_name": "a.png"}])
+client = TestClient(main.app)
+assert client.get("/questions").json()["questions"][0]["question_id"] == "q1"
+report = client.get("/startup").json()
+heavy = [name for name in ("cv2", "numpy", "PIL", "pypdfium2", "supabase") if name in sys.modules]
+assert heavy == [], heavy
+assert report["entries"][0]["name"] == "app.main"
+"""
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,69 @@
+import httpx
+
+from app.utils import supabase_client
+
+
+def test_upload_files_batch_reports_each_file(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.url.path.endswith("broken.png"):
+            return httpx.Response(400, json={"message": "Duplicate"})
+        return httpx.Response(200, json={"Key": request.url.path})
+
+    client = httpx.Client(base_url="http://storage.test/storage/v1", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(supabase_client, "_http_client", client)
+
+    results = supabase_client.upload_files_batch(
+        [
+            {"destination_path": "a.png", "data": b"a"},
+            {"destination_path": "broken.png", "data": b"b"},
+            {"destination_path": "c.jpg", "data": b"c", "content_type": "image/jpeg"},
+            {"destination_path": "paper 1/q 2.png", "data": b"d"},
+        ],
+        max_concurrency=2,
+    )
+
+    assert [r["destination_path"] for r in results] == ["a.png", "broken.png", "c.jpg", "paper 1/q 2.png"]
+    assert [r["success"] for r in results] == [True, False, True, True]
+    assert results[0]["url"] == supabase_client.build_public_url("a.png")
+    assert "Duplicate" in results[1]["error"]
+    assert len(requests) == 4
+    # The public URL names the object under the same quoted path it was uploaded to
+    uploaded = next(r for r in requests if "paper" in r.url.raw_path.decode())
+    assert uploaded.url.raw_path.decode().endswith("/paper%201/q%202.png")
+    assert results[3]["url"].endswith("/object/public/" + supabase_client.SUPABASE_BUCKET + "/paper%201/q%202.png")
+    assert {r.headers["content-type"] for r in requests} == {"image/png", "image/jpeg"}
+
+
+def test_upload_bytes_streams_memory_mapped_data(monkeypatch, tmp_path):
+    import mmap
+
+    bodies = []
+
+    def handler(request):
+        assert "transfer-encoding" not in request.headers
+        bodies.append((request.headers["content-length"], request.read()))
+        return httpx.Response(200, json={"Key": request.url.path})
+
+    client = httpx.Client(base_url="http://storage.test/storage/v1", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(supabase_client, "_http_client", client)
+    readers = []
+
+    class RecordingReader(supabase_client.BufferReader):
+        def __init__(self, buffer):
+            super().__init__(buffer)
+            readers.append(self)
+
+    monkeypatch.setattr(supabase_client, "BufferReader", RecordingReader)
+
+    path = tmp_path / "scan.bin"
+    path.write_bytes(b"x" * 200_000 + b"end")
+    with open(path, "rb") as source:
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    supabase_client.upload_bytes("scan.bin", mapped, content_type="application/octet-stream")
+    assert bodies == [("200003", b"x" * 200_000 + b"end")]
+    # No view of the mapping is left behind
+    assert len(readers) == 1 and readers[0].closed
+    mapped.close()